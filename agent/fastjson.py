@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+# Environment: managed with 'uv' (https://github.com/astral-sh/uv). See README for setup.
+# JSON encoding and buffered JSONL logs for hot paths: orjson when installed, stdlib json otherwise.
+import atexit
+import json
+import os
+import time
+import weakref
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ORJSON_OPTS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes (non-ASCII kept as-is)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=_ORJSON_OPTS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    """Same as dumps(), decoded to str for text-mode consumers."""
+    return dumps(obj).decode("utf-8")
+
+
+def loads(data: str | bytes) -> Any:
+    """Parse JSON text. Input orjson rejects but stdlib json accepts (e.g. NaN) is retried with json."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass
+    return json.loads(data)
+
+
+# JSONL logs are buffered in-process and drained in batches rather than flushed per event
+_LOG_FLUSH_EVERY = 8
+_LOG_FLUSH_BYTES = 64 * 1024
+_LOG_FLUSH_INTERVAL_S = 0.5
+
+
+class JsonlWriter:
+    """Append-only JSONL file behind a raw O_APPEND descriptor.
+
+    Lines accumulate in a bytearray and reach the OS in a single write once
+    _LOG_FLUSH_EVERY lines, _LOG_FLUSH_BYTES or _LOG_FLUSH_INTERVAL_S have built up.
+    With sync=True every line is written through immediately.
+    """
+    def __init__(self, path: str, sync: bool = False):
+        self.path = path
+        self.sync = sync
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        self._buf = bytearray()
+        self._lines = 0
+        self._last_flush = time.monotonic()
+        _OPEN_WRITERS.add(self)
+
+    def write(self, obj: Any):
+        self.write_line(dumps(obj))
+
+    def write_line(self, line: bytes):
+        """Buffer one pre-serialized JSON line (without the trailing newline)."""
+        self._buf += line
+        self._buf += b"\n"
+        self._lines += 1
+        if (
+            self.sync
+            or self._lines >= _LOG_FLUSH_EVERY
+            or len(self._buf) >= _LOG_FLUSH_BYTES
+            or time.monotonic() - self._last_flush >= _LOG_FLUSH_INTERVAL_S
+        ):
+            self.flush()
+
+    def flush(self):
+        if self._buf and self._fd >= 0:
+            buf = self._buf
+            while buf:
+                del buf[:os.write(self._fd, buf)]
+            self._lines = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._fd < 0:
+            return
+        try:
+            self.flush()
+        finally:
+            fd, self._fd = self._fd, -1
+            _OPEN_WRITERS.discard(self)
+            os.close(fd)
+
+
+# Writers that may still hold buffered lines; flushed at interpreter exit in case an owner
+# never reaches close() (e.g. a script that exits without try/finally)
+_OPEN_WRITERS: weakref.WeakSet[JsonlWriter] = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_writers():
+    for writer in list(_OPEN_WRITERS):
+        try:
+            writer.flush()
+        except OSError:
+            pass
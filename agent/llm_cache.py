@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+# Environment: managed with 'uv' (https://github.com/astral-sh/uv). See README for setup.
+# Reply cache for deterministic (temperature 0) model calls: identical prompt + screenshot -> stored reply.
+import hashlib
+import os
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Any
+
+from agent import fastjson
+
+# Step fields that feed the key. Indices, screenshot paths and timing meta differ on every run, so
+# keying on them would keep a rerun of the same task from ever hitting.
+_HISTORY_KEY_FIELDS = ("plan", "next_action", "args", "say", "observation")
+
+
+class LLMCache:
+    """In-memory LRU of model replies, optionally backed by one file per key in a directory.
+
+    The directory defaults to $DESKTOPOPS_CACHE_DIR, so cached replies survive reruns only when asked for.
+    Replies are stored serialized and decoded on every hit; callers may mutate what they get back.
+    """
+
+    def __init__(self, namespace: str, maxsize: int = 256, cache_dir: str | None = None):
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir if cache_dir is not None else os.environ.get("DESKTOPOPS_CACHE_DIR")
+        self.stats: dict[str, int] = {"hits": 0, "misses": 0}
+        self._mem: OrderedDict[str, bytes] = OrderedDict()
+
+    def key(self, instruction: str, recent_steps: list[dict[str, Any]], image: bytes | str | None) -> str:
+        # Hash the screenshot separately so the key material stays small
+        if isinstance(image, str):
+            image = image.encode("ascii", "ignore")
+        image_digest = hashlib.sha256(image).hexdigest() if image else None
+        history = [[step.get(f) for f in _HISTORY_KEY_FIELDS] for step in recent_steps]
+        material = fastjson.dumps([self.namespace, instruction, history, image_digest])
+        return hashlib.sha256(material).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Any:
+        data = self._mem.get(key)
+        if data is not None:
+            self._mem.move_to_end(key)
+        elif self.cache_dir:
+            with suppress(OSError):
+                with open(self._path(key), "rb") as fp:
+                    data = fp.read()
+                self._remember(key, data)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return fastjson.loads(data)
+
+    def set(self, key: str, value: Any) -> None:
+        data = fastjson.dumps(value)
+        self._remember(key, data)
+        if self.cache_dir:
+            with suppress(OSError):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp = self._path(key) + ".tmp"
+                with open(tmp, "wb") as fp:
+                    fp.write(data)
+                os.replace(tmp, self._path(key))
+
+    def discard(self, key: str) -> None:
+        self._mem.pop(key, None)
+        if self.cache_dir:
+            with suppress(OSError):
+                os.remove(self._path(key))
+
+    def _remember(self, key: str, data: bytes) -> None:
+        self._mem[key] = data
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.maxsize:
+            self._mem.popitem(last=False)
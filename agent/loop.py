@@ -1,26 +1,223 @@
 from __future__ import annotations
 # Environment: managed with 'uv' (https://github.com/astral-sh/uv). See README for setup.
-import json
 import os
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from collections.abc import Callable
+from contextlib import suppress
+from dataclasses import dataclass
+from functools import lru_cache, partial
 from typing import Any, Dict, List
-from agent.parser import parse_structured_output, parse_step, clean_model_text
+from agent.model import MODEL_HISTORY_STEPS
+from agent.parser import parse_structured_output, parse_structured_payload, parse_step, clean_model_text
 from tools.input import InputController
 from tools.screen import Screen
 from tools import overlay
 from ui.console import print_step_table, say_to_user
 from agent.state import Step
+from agent import fastjson
+from agent.fastjson import JsonlWriter
+from PIL import Image, ImageChops, ImageStat
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+# Verify regions larger than this (e.g. the 600x400 SCROLL strip) are diffed on a 4x subsample
+_DIFF_SUBSAMPLE_MIN_PIXELS = 40_000
+
+
+@dataclass(frozen=True, slots=True)
+class LoopCfg:
+    """Static loop settings parsed once from the YAML config."""
+    max_steps: int
+    min_interval_ms: int
+    shot_w: int
+    shot_q: int
+    shot_fmt: str
+    shot_save_png: bool
+    overlay_enabled: bool
+    overlay_ms: int
+    overlay_always_on_enabled: bool
+    overlay_always_on_radius: int
+    overlay_always_on_poll_ms: int
+    ocr_enabled: bool
+    uia_enabled: bool
+    log_sync: bool
+
+
+def _shot_format(value) -> str:
+    fmt = str(value).strip().lower()
+    fmt = "jpeg" if fmt == "jpg" else fmt
+    if fmt not in ("jpeg", "webp"):
+        raise ValueError(f"screenshot.format must be 'jpeg' or 'webp', got {value!r}")
+    return fmt
+
+
+def _load_cfg(cfg: dict[str, Any]) -> LoopCfg:
+    """Build a LoopCfg from the raw config dict; raises ValueError on malformed values."""
+    def section(*path):
+        d = cfg
+        for key in path:
+            d = d.get(key) if isinstance(d, dict) else None
+        return d if isinstance(d, dict) else {}
+
+    loop_c, shot_c, ov_c = section("loop"), section("screenshot"), section("overlay")
+    ao_c = section("overlay", "always_on")
+    try:
+        return LoopCfg(
+            max_steps=int(loop_c.get("max_steps", 50)),
+            min_interval_ms=int(loop_c.get("min_interval_ms", 300)),
+            shot_w=int(shot_c.get("width", 1280)),
+            shot_q=int(shot_c.get("quality", 70)),
+            shot_fmt=_shot_format(shot_c.get("format", "jpeg")),
+            # By default the JPEG sent to the model is what lands on disk; PNG re-encode is opt-in
+            shot_save_png=bool(shot_c.get("save_png", False)),
+            overlay_enabled=bool(ov_c.get("enabled", False)),
+            overlay_ms=int(ov_c.get("duration_ms", 250)),
+            overlay_always_on_enabled=bool(ao_c.get("enabled", False)),
+            overlay_always_on_radius=int(ao_c.get("radius", 18)),
+            overlay_always_on_poll_ms=int(ao_c.get("poll_ms", 80)),
+            ocr_enabled=bool(section("ocr").get("enabled", False)),
+            uia_enabled=bool(section("windows_uia").get("enabled", False)),
+            log_sync=bool(section("logging").get("sync", False)),
+        )
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid loop/screenshot/overlay config: {e}") from e
+
+
+@dataclass
+class _StepContext:
+    """Per-step state shared by the action handlers."""
+    idx: int
+    image: Any  # PIL image sent to the model
+    screen_w: int
+    screen_h: int
+    scale_x: float
+    scale_y: float
+    # (x_raw, y_raw, source) from _extract_xy; filled only for pointer actions
+    xy: tuple[Any, Any, Any] = (None, None, None)
+
+
+def _is_num(v) -> bool:
+    try:
+        float(v)
+        return True
+    except Exception:
+        return False
+
+
+def _extract_xy(args_ref: dict[str, Any]):
+    """Flexible coordinate extractor to tolerate common schemas."""
+    # 1) Direct x/y
+    if _is_num(args_ref.get("x")) and _is_num(args_ref.get("y")):
+        return args_ref.get("x"), args_ref.get("y"), "x,y"
+    # 2) Aliases: cx,cy
+    if _is_num(args_ref.get("cx")) and _is_num(args_ref.get("cy")):
+        return args_ref.get("cx"), args_ref.get("cy"), "cx,cy"
+    # 3) coordinates/point/position as list/tuple
+    for k in ("coordinates", "point", "position", "center", "target", "location"):
+        v = args_ref.get(k)
+        if isinstance(v, (list, tuple)) and len(v) == 2 and _is_num(v[0]) and _is_num(v[1]):
+            return v[0], v[1], k
+        if isinstance(v, dict) and _is_num(v.get("x")) and _is_num(v.get("y")):
+            return v.get("x"), v.get("y"), f"{k}.x,y"
+    # 4) bbox handled in _process_coords separately
+    return None, None, None
+
+
+# Scalar args consumed by each action handler as (key, cast, default); coordinates are
+# resolved separately by _extract_xy/_process_coords because they accept several shapes.
+ACTION_ARG_SCHEMAS: dict[str, tuple[tuple[str, Callable[[Any], Any], Any], ...]] = {
+    "MOVE": (("duration", float, 0.0),),
+    "CLICK": (("button", str, "left"), ("clicks", int, 1), ("interval", float, 0.1)),
+    "SCROLL": (("amount", int, -600),),
+    "DRAG": (("duration", float, 0.2),),
+    "WAIT": (("seconds", float, 0.5),),
+}
+
+
+def _coerce(args: dict[str, Any], schema) -> tuple:
+    """Apply an ACTION_ARG_SCHEMAS entry in one pass; missing/None values take the default."""
+    get = args.get
+    out = []
+    for key, cast, default in schema:
+        v = get(key)
+        out.append(default if v is None else cast(v))
+    return tuple(out)
+
+
+def _norm_mean_abs_diff(a_img, b_img) -> float:
+    try:
+        if a_img.size != b_img.size:
+            b_img = b_img.resize(a_img.size)
+        w, h = a_img.size
+        if w * h > _DIFF_SUBSAMPLE_MIN_PIXELS:
+            # Point-sample every 4th pixel on both axes: an unbiased estimate of the mean absolute
+            # difference. A box-filter reduce would average out mixed-sign changes such as shifted text.
+            size = (max(1, w // 4), max(1, h // 4))
+            a_img = a_img.resize(size, Image.NEAREST)
+            b_img = b_img.resize(size, Image.NEAREST)
+        a_g = a_img.convert("L")
+        b_g = b_img.convert("L")
+        if np is not None:
+            # One subtract/abs/mean over uint8 views instead of a diff image plus an ImageStat pass
+            a = np.asarray(a_g, dtype=np.int16)
+            b = np.asarray(b_g, dtype=np.int16)
+            return float(np.abs(a - b).mean()) / 255.0
+        diff = ImageChops.difference(a_g, b_g)
+        stat = ImageStat.Stat(diff)
+        # Mean absolute difference normalized to [0,1]
+        mad = stat.mean[0] / 255.0
+        return float(mad)
+    except Exception:
+        return 0.0
+
+
+def _save_verify_image(img, path: str):
+    """Write a verification crop; these are audit images, so a cheap JPEG is enough."""
+    img.save(path, format="JPEG", quality=60)
+
+
+@lru_cache(maxsize=1)
+def _cursor_pos_fn():
+    """Resolve the cursor-position backend once; a failed import is not cached by Python itself."""
+    try:
+        import win32api  # type: ignore
+        return win32api.GetCursorPos
+    except Exception:
+        pass
+    try:
+        import pyautogui as _pg
+        return _pg.position
+    except Exception:
+        return None
+
+
+def _cursor_pos():
+    """Cursor position for diagnostics, or None if no backend is available."""
+    fn = _cursor_pos_fn()
+    if fn is None:
+        return None
+    try:
+        x, y = fn()
+        return int(x), int(y)
+    except Exception:
+        return None
+
 
 class Stepper:
     def __init__(self, cfg: Dict[str, Any], run_dir: str, model_adapter, console):
         self.cfg = cfg
         self.run_dir = run_dir
+        self.run_id = os.path.basename(run_dir)
         self.model = model_adapter
         self.console = console
         # Prepare per-session logs directory (logs/<timestamp-from-run_dir>)
         try:
-            ts_id = os.path.basename(run_dir)
-            self.logs_dir = os.path.join("logs", ts_id)
+            self.logs_dir = os.path.join("logs", self.run_id)
             os.makedirs(self.logs_dir, exist_ok=True)
         except Exception:
             self.logs_dir = os.path.join("logs", "latest")
@@ -43,630 +240,277 @@ class Stepper:
             pass
         self.input = InputController(dry_run=bool(cfg.get("dry_run", True)))
         self.screen = Screen(run_dir=run_dir)
+        # Single background writer for screenshots so encode/disk time stays off the step loop
+        self._io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stepper-io")
+        self._pending_io: list[Future] = []
         self.steps: List[Step] = []
+        # Serialized tail of the history handed to the model (adapters only read the last few)
+        self._recent_steps_json: deque[dict[str, Any]] = deque(maxlen=MODEL_HISTORY_STEPS)
         self.last_observation = ""
+        # Static settings; resolved once per session
+        self._loopcfg = _load_cfg(self.cfg)
+        log_sync = self._loopcfg.log_sync
         self.log_path = os.path.join(run_dir, "steps.jsonl")
-        self.log_fp = open(self.log_path, "a", encoding="utf-8")
+        self._step_log = JsonlWriter(self.log_path, sync=log_sync)
         # Extra diagnostics log (now under logs/ per session)
         self.debug_path = os.path.join(self.logs_dir, "debug.jsonl")
         try:
-            self.debug_fp = open(self.debug_path, "a", encoding="utf-8")
+            self._debug_log = JsonlWriter(self.debug_path, sync=log_sync)
         except Exception:
-            self.debug_fp = None
+            self._debug_log = None
         # Aggregate session log
+        self.session_log_path = os.path.join(self.logs_dir, "session.jsonl")
         try:
-            self.session_log_path = os.path.join(self.logs_dir, "session.jsonl")
-            self.session_log_fp = open(self.session_log_path, "a", encoding="utf-8")
-            self.session_log_fp.write(json.dumps({
+            self._session_log = JsonlWriter(self.session_log_path, sync=log_sync)
+            self._session_log.write({
                 "type": "session_start",
                 "run_dir": run_dir,
                 "logs_dir": self.logs_dir,
                 "provider": self.cfg.get("provider"),
                 "model": self.cfg.get("model"),
                 "dry_run": bool(self.cfg.get("dry_run", True)),
-            }) + "\n")
-            self.session_log_fp.flush()
+            })
         except Exception:
-            self.session_log_fp = None
+            self._session_log = None
         # Error counters by type for observability
         self.error_counts: Dict[str, int] = {}
+        verify_cfg = self.cfg.get("verify", {})
+        self._verify_cfg: dict[str, Any] = verify_cfg if isinstance(verify_cfg, dict) else {}
+        self._verify_wait_s = max(0.0, int(self._verify_cfg.get("wait_ms", 180)) / 1000.0)
+        self._save_verify = bool(self._verify_cfg.get("save_images", True))
+        # Dry-run input never touches the screen, so there is nothing for a before/after diff to see
+        self._verify_enabled = not self.input.dry_run and bool(self._verify_cfg.get("enabled", True))
+        self._verify_path_fmt = os.path.join(self.run_dir, "verify_step_{:04d}_{}.jpg")
+        # next_action -> (bound handler, needs_xy); a single hash lookup per step instead of an
+        # if/elif chain. Pointer actions get their coordinates extracted once, into ctx.xy.
+        self._action_table: dict[str, tuple[Callable, bool]] = {
+            "MOVE": (self._do_move, True),
+            "CLICK": (self._do_click, True),
+            "DOUBLE_CLICK": (partial(
+                self._do_click, clicks_override=2, label="double-click",
+                threshold_key="double_click_delta_threshold", threshold_default=0.02,
+            ), True),
+            "RIGHT_CLICK": (partial(
+                self._do_click, button_override="right", clicks_override=1, label="right-click",
+                threshold_key="right_click_delta_threshold",
+            ), True),
+            "TYPE": (self._do_type, False),
+            "HOTKEY": (self._do_hotkey, False),
+            "SCROLL": (self._do_scroll, False),
+            "DRAG": (self._do_drag, True),
+            "WAIT": (self._do_wait, False),
+            "NONE": (self._do_none, False),
+        }
         # Always-on overlay (optional)
-        self._overlay_always_on = False
+        self._overlay_always_on = self._maybe_start_always_on_overlay()
+
+    def _maybe_start_always_on_overlay(self) -> bool:
+        lc = self._loopcfg
+        if not lc.overlay_always_on_enabled:
+            return False
         try:
-            ao_cfg = self.cfg.get("overlay", {}).get("always_on", {})
-            if bool(ao_cfg.get("enabled", False)):
-                try:
-                    overlay.start_always_on(
-                        radius=int(ao_cfg.get("radius", 18)),
-                        poll_ms=int(ao_cfg.get("poll_ms", 80)),
-                    )
-                    self._overlay_always_on = True
-                except Exception as e:
-                    self._overlay_always_on = False
-                    # Non-silent: inform user overlay always-on could not start
-                    say_to_user(f"Overlay always-on not started: {e}")
+            overlay.start_always_on(radius=lc.overlay_always_on_radius, poll_ms=lc.overlay_always_on_poll_ms)
+            return True
         except Exception as e:
-            self._overlay_always_on = False
-            say_to_user(f"Overlay config error: {e}")
+            # Non-silent: inform user overlay always-on could not start
+            say_to_user(f"Overlay always-on not started: {e}")
+            return False
 
     def _log(self, obj: Dict[str, Any]):
-        self.log_fp.write(json.dumps(obj, ensure_ascii=False) + "\n")
-        self.log_fp.flush()
+        line = fastjson.dumps(obj)
+        self._step_log.write_line(line)
         try:
-            if getattr(self, "session_log_fp", None):
-                self.session_log_fp.write(json.dumps({"source":"steps","data":obj}, ensure_ascii=False) + "\n")
-                self.session_log_fp.flush()
+            if self._session_log:
+                # Splice the already-encoded record into the session envelope rather than re-encoding it
+                self._session_log.write_line(b'{"source":"steps","data":' + line + b"}")
         except Exception:
             pass
 
     def _log_debug(self, obj: Dict[str, Any]):
         try:
-            if self.debug_fp:
-                self.debug_fp.write(json.dumps(obj, ensure_ascii=False) + "\n")
-                self.debug_fp.flush()
-            if getattr(self, "session_log_fp", None):
-                self.session_log_fp.write(json.dumps({"source":"debug","data":obj}, ensure_ascii=False) + "\n")
-                self.session_log_fp.flush()
+            line = fastjson.dumps(obj)
+            if self._debug_log:
+                self._debug_log.write_line(line)
+            if self._session_log:
+                self._session_log.write_line(b'{"source":"debug","data":' + line + b"}")
         except Exception:
             pass
 
+    def _flush_logs(self):
+        """Hand everything buffered for the JSONL logs to the OS."""
+        for sink in (self._step_log, self._debug_log, self._session_log):
+            if sink is not None:
+                with suppress(Exception):
+                    sink.flush()
+
+    def _submit_io(self, fn, *args):
+        """Queue a disk write on the background writer."""
+        self._pending_io = [f for f in self._pending_io if not f.done() or f.exception()]
+        self._pending_io.append(self._io_pool.submit(fn, *args))
+
+    def _wait_io(self):
+        """Block until queued writes finish; failures go to the debug log."""
+        pending, self._pending_io = self._pending_io, []
+        for fut in pending:
+            err = fut.exception()
+            if err is not None:
+                self.error_counts["io_error"] = self.error_counts.get("io_error", 0) + 1
+                self._log_debug({"type": "io_error", "error": str(err)})
+
     def close(self):
-        try:
-            self.log_fp.close()
-        except Exception:
-            pass
-        try:
-            if self.debug_fp:
-                self.debug_fp.close()
-        except Exception:
-            pass
-        try:
-            if getattr(self, "session_log_fp", None):
-                self.session_log_fp.write(json.dumps({"type":"session_end"}) + "\n")
-                self.session_log_fp.close()
-        except Exception:
-            pass
-        try:
+        # Order matters: finish background writes (their errors go to the debug log) before the logs close
+        with suppress(Exception):
+            self._wait_io()
+            self._io_pool.shutdown(wait=True)
+        with suppress(Exception):
+            self._step_log.close()
+        with suppress(Exception):
+            if self._debug_log:
+                self._debug_log.close()
+        with suppress(Exception):
+            if self._session_log:
+                self._session_log.write({"type": "session_end"})
+                self._session_log.close()
+        with suppress(Exception):
             if self._overlay_always_on:
                 overlay.stop_always_on()
-        except Exception:
-            pass
+        with suppress(Exception):
+            closer = getattr(self.model, "close", None)
+            if callable(closer):
+                closer()
 
     def run_instruction(self, instruction: str):
-        max_steps = int(self.cfg.get("loop", {}).get("max_steps", 50))
-        min_interval_ms = int(self.cfg.get("loop", {}).get("min_interval_ms", 300))
-        shot_w = int(self.cfg.get("screenshot", {}).get("width", 1280))
-        shot_q = int(self.cfg.get("screenshot", {}).get("quality", 70))
-        overlay_enabled = bool(self.cfg.get("overlay", {}).get("enabled", False))
-        overlay_ms = int(self.cfg.get("overlay", {}).get("duration_ms", 250))
+        lc = self._loopcfg
+        max_steps = lc.max_steps
+        min_interval_s = max(0.0, lc.min_interval_ms / 1000.0)
+        shot_w = lc.shot_w
+        shot_q = lc.shot_q
+        shot_fmt = lc.shot_fmt
+        shot_save_png = lc.shot_save_png
+        ocr_enabled = lc.ocr_enabled
+        uia_enabled = lc.uia_enabled
+        action_table = self._action_table
+        # Hot callables bound once per instruction (LOAD_FAST in the loop instead of attribute chains)
+        capture_jpeg = self.screen.capture_jpeg
+        model_step = self.model.step
+        log = self._log
+        log_debug = self._log_debug
+        steps_append = self.steps.append
+        recent_steps_json = self._recent_steps_json
+        monotonic = time.monotonic
 
         say_to_user("Got it. Working step-by-step.")
 
         # Discover actual screen size once per run. Used for clamping and telemetry.
+        # The probe frame doubles as step 1's screenshot, so the first step skips a grab.
         actual_screen_img = self.screen.capture()
         actual_width = actual_screen_img.width
         actual_height = actual_screen_img.height
+        encode_jpeg = self.screen.encode_jpeg
         say_to_user(f"Screen: {actual_width}x{actual_height}, Screenshot sent to model: {shot_w}px wide")
 
+        # Determine tool availability from config
+        tools = ["MOVE","CLICK","DOUBLE_CLICK","RIGHT_CLICK","TYPE","HOTKEY","SCROLL","DRAG","WAIT","NONE"]
+        if uia_enabled:
+            tools += ["UIA_INVOKE","UIA_SET_VALUE"]
+        # NOTE: OCR path is Phase 2; include only when enabled
+        if ocr_enabled:
+            tools += ["CLICK_TEXT"]
+
+        # Augment instruction with explicit coordinate contract, sizes, and tools availability
+        instr_aug_head = f"{instruction}\n\nContext: actual_screen={actual_width}x{actual_height}, image_to_model="
+        instr_aug_tail = (
+            f". Tools available: {', '.join(tools)}. "
+            f"If a tool is not listed as available, you must not use it. "
+            f"Return ABSOLUTE screen coordinates in this {actual_width}x{actual_height} space for pointer actions. "
+            f"Do not return normalized coordinates. Ensure coordinates are within bounds."
+        )
+        instr_aug_size = None
+        instr_aug = ""
+
         done = False
+        last_shot = (None, None)  # (img_jpeg, shot_path) of the previous step
         for idx in range(1, max_steps + 1):
-            img_b64, pil_img = self.screen.capture_and_encode(width=shot_w, quality=shot_q)
+            # Pace step starts at least min_interval apart; time spent in the step counts toward it
+            deadline = monotonic() + min_interval_s
+            if actual_screen_img is not None:
+                img_jpeg, pil_img = encode_jpeg(actual_screen_img, width=shot_w, quality=shot_q, fmt=shot_fmt)
+                actual_screen_img = None
+            else:
+                img_jpeg, pil_img = capture_jpeg(width=shot_w, quality=shot_q, fmt=shot_fmt)
+            # Screen.capture_jpeg hands back the same bytes object for a pixel-identical frame
+            shot_path = last_shot[1] if img_jpeg is last_shot[0] else None
 
             # Calculate reference scale factors: screenshot → screen (for telemetry only)
             scale_x = actual_width / pil_img.width if pil_img.width else 1.0
             scale_y = actual_height / pil_img.height if pil_img.height else 1.0
 
-            # Determine tool availability from config
-            ocr_enabled = bool(self.cfg.get("ocr", {}).get("enabled", False))
-            uia_enabled = bool(self.cfg.get("windows_uia", {}).get("enabled", False))
-            tools = ["MOVE","CLICK","DOUBLE_CLICK","RIGHT_CLICK","TYPE","HOTKEY","SCROLL","DRAG","WAIT","NONE"]
-            if uia_enabled:
-                tools += ["UIA_INVOKE","UIA_SET_VALUE"]
-            # NOTE: OCR path is Phase 2; include only when enabled
-            if ocr_enabled:
-                tools += ["CLICK_TEXT"]
-
-            # Augment instruction with explicit coordinate contract, sizes, and tools availability
-            instr_aug = (
-                f"{instruction}\n\n"
-                f"Context: actual_screen={actual_width}x{actual_height}, image_to_model={pil_img.width}x{pil_img.height}. "
-                f"Tools available: {', '.join(tools)}. "
-                f"If a tool is not listed as available, you must not use it. "
-                f"Return ABSOLUTE screen coordinates in this {actual_width}x{actual_height} space for pointer actions. "
-                f"Do not return normalized coordinates. Ensure coordinates are within bounds."
-            )
-            self._log_debug({
+            # Only the image size can vary between steps; rebuild the prompt when it does
+            if pil_img.size != instr_aug_size:
+                instr_aug_size = pil_img.size
+                instr_aug = f"{instr_aug_head}{pil_img.width}x{pil_img.height}{instr_aug_tail}"
+            log_debug({
                 "type": "model_call",
                 "step_index": idx,
                 "actual": [actual_width, actual_height],
                 "image": [pil_img.width, pil_img.height],
                 "scale": [scale_x, scale_y],
-                "overlay_enabled": overlay_enabled,
+                "overlay_enabled": lc.overlay_enabled,
                 "instruction": instruction,
                 "instruction_augmented": instr_aug[:800],
             })
 
-            raw = self.model.step(instr_aug, self.last_observation, [s.to_json() for s in self.steps], img_b64)
-            self._log_debug({
-                "type": "model_raw",
-                "step_index": idx,
-                "raw_preview": (raw if isinstance(raw, str) else json.dumps(raw))[:1500]
-            })
+            # Persist the step screenshot in the background; only the path is needed on this thread
+            if shot_path is None:
+                shot_src = pil_img if shot_save_png else img_jpeg
+                shot_path = self.screen.step_image_path(shot_src, idx)
+                self._submit_io(self.screen.write_step_image, shot_src, shot_path)
+            raw = model_step(instr_aug, self.last_observation, list(recent_steps_json), img_jpeg)
             # Hardened parsing + validation with observability
-            run_id = os.path.basename(self.run_dir)
-            raw_text = raw if isinstance(raw, str) else json.dumps(raw)
-            cleaned_text = clean_model_text(raw_text)
-            parse_err = None
-            try:
-                payload = parse_step(raw_text, ocr_enabled=bool(self.cfg.get("ocr", {}).get("enabled", False)))
-            except Exception as e:
-                parse_err = str(e)
+            # Dict replies are validated directly; text replies are cleaned and parsed
+            payload, parse_err = parse_structured_payload(raw, ocr_enabled=ocr_enabled)
+            if parse_err:
                 # Increment counters
                 key = "parse_error"
                 self.error_counts[key] = self.error_counts.get(key, 0) + 1
+                # Keep a reply cache from replaying it on the next run
+                discard = getattr(self.model, "discard_cached_reply", None)
+                if callable(discard):
+                    discard()
                 payload = {"plan":"report parsing error","say":f"Parser error: {parse_err}","next_action":"NONE","args":{},"done":False}
-            # Debug log minimal but actionable
-            self._log_debug({
+            else:
+                parse_err = None
+            # Debug log minimal but actionable: one record per reply; dict replies are logged as-is
+            parsed_rec = {
                 "type": "model_parsed",
                 "step_index": idx,
-                "run_id": run_id,
-                "raw": raw_text[:1500],
-                "cleaned": cleaned_text[:1500],
+                "run_id": self.run_id,
+                "raw": raw[:1500] if isinstance(raw, str) else raw,
                 "parse_error": parse_err,
                 "parsed_preview": {k: payload.get(k) for k in ["plan","next_action","args","done"]}
-            })
+            }
+            if isinstance(raw, str):
+                try:
+                    cleaned_text = clean_model_text(raw)
+                except ValueError:
+                    cleaned_text = ""
+                # Only worth logging when cleaning actually stripped something
+                if cleaned_text != raw:
+                    parsed_rec["cleaned"] = cleaned_text[:1500]
+            log_debug(parsed_rec)
             act = payload["next_action"]
             args = payload["args"] or {}
-            observation = ""
-
-            # Helper: clamp to the valid screen rectangle
-            def clamp_to_screen(x, y):
-                if x is None or y is None:
-                    return x, y, False
-                xi = int(x)
-                yi = int(y)
-                clamped_x = max(0, min(actual_width - 1, xi))
-                clamped_y = max(0, min(actual_height - 1, yi))
-                clamped = (clamped_x != xi) or (clamped_y != yi)
-                return clamped_x, clamped_y, clamped
-
-            # Helper: process coordinates from the model.
-            # Supports:
-            #  - Absolute screen coords (default, no scaling)
-            #  - Normalized coords scaled to 1000 (0..1000) → screen via actual dims
-            #  - Bounding box [x1,y1,x2,y2] → center point (handles normalized_1000)
-            def process_coords(x_raw, y_raw, args_ref=None):
-                coord_system = "screen_absolute"
-                bbox = None
-                bx = by = None
-                # 1) If bbox provided, compute center (normalized_1000 if values <=1000)
-                if args_ref and isinstance(args_ref.get("bbox"), (list, tuple)) and len(args_ref.get("bbox")) == 4:
-                    try:
-                        x1, y1, x2, y2 = [float(v) for v in args_ref.get("bbox")]
-                        bbox = [x1, y1, x2, y2]
-                        if max(abs(x1), abs(y1), abs(x2), abs(y2)) <= 1000.5:
-                            coord_system = "normalized_1000_bbox"
-                            cx = (x1 + x2) / 2.0
-                            cy = (y1 + y2) / 2.0
-                            bx = int(round((cx / 1000.0) * actual_width))
-                            by = int(round((cy / 1000.0) * actual_height))
-                        else:
-                            coord_system = "screen_bbox"
-                            bx = int(round((x1 + x2) / 2.0))
-                            by = int(round((y1 + y2) / 2.0))
-                    except Exception:
-                        bbox = None
-
-                # 2) Coord system hint
-                if args_ref and isinstance(args_ref.get("coord_system"), str):
-                    hint = args_ref.get("coord_system").strip().lower()
-                    if hint in {"normalized_1000", "normalized-1000", "norm_1000"}:
-                        coord_system = "normalized_1000"
-                    elif hint in {"unit_normalized", "normalized", "0_1", "[0,1]"}:
-                        coord_system = "unit_normalized"
-
-                # 3) Choose source coords
-                src_x, src_y = (bx, by) if (bx is not None and by is not None) else (x_raw, y_raw)
-
-                # 4) Heuristic detect if not hinted
-                try:
-                    if src_x is not None and src_y is not None and coord_system == "screen_absolute":
-                        sx = float(src_x); sy = float(src_y)
-                        if 0.0 <= sx <= 1.0 and 0.0 <= sy <= 1.0:
-                            coord_system = "unit_normalized"
-                        elif 0.0 <= sx <= 1000.5 and 0.0 <= sy <= 1000.5:
-                            coord_system = "normalized_1000"
-                except Exception:
-                    pass
-
-                # 5) Map to screen coords
-                if src_x is None or src_y is None:
-                    x_final, y_final = src_x, src_y
-                    clamped = False
-                else:
-                    if coord_system in {"normalized_1000", "normalized_1000_bbox"}:
-                        xf = int(round((float(src_x) / 1000.0) * actual_width))
-                        yf = int(round((float(src_y) / 1000.0) * actual_height))
-                    elif coord_system == "unit_normalized":
-                        xf = int(round(float(src_x) * actual_width))
-                        yf = int(round(float(src_y) * actual_height))
-                    else:  # screen_absolute/screen_bbox
-                        xf = int(round(float(src_x)))
-                        yf = int(round(float(src_y)))
-                    x_final, y_final, clamped = clamp_to_screen(xf, yf)
-
-                # Heuristics
-                raw_exceeds_image = False
-                try:
-                    if x_raw is not None and y_raw is not None:
-                        raw_exceeds_image = (float(x_raw) >= float(pil_img.width)) or (float(y_raw) >= float(pil_img.height))
-                except Exception:
-                    pass
-
-                meta = {
-                    "screen": {"width": actual_width, "height": actual_height},
-                    "image": {"width": pil_img.width, "height": pil_img.height},
-                    "coords": {"raw": [x_raw, y_raw], "final": [x_final, y_final]},
-                    "bbox": bbox,
-                    "scaling": {"mode": coord_system, "scale_x": scale_x, "scale_y": scale_y, "applied": coord_system != "screen_absolute"},
-                    "clamped": clamped,
-                    "heuristics": {"raw_exceeds_image": raw_exceeds_image},
-                }
-                return x_final, y_final, clamped, meta
-
-            step_meta = None
-            # Flexible coordinate extractor to tolerate common schemas
-            def _extract_xy(args_ref: Dict[str, Any]):
-                def _is_num(v):
-                    try:
-                        float(v)
-                        return True
-                    except Exception:
-                        return False
-                # 1) Direct x/y
-                if _is_num(args_ref.get("x")) and _is_num(args_ref.get("y")):
-                    return args_ref.get("x"), args_ref.get("y"), "x,y"
-                # 2) Aliases: cx,cy
-                if _is_num(args_ref.get("cx")) and _is_num(args_ref.get("cy")):
-                    return args_ref.get("cx"), args_ref.get("cy"), "cx,cy"
-                # 3) coordinates/point/position as list/tuple
-                for k in ("coordinates", "point", "position", "center", "target", "location"):
-                    v = args_ref.get(k)
-                    if isinstance(v, (list, tuple)) and len(v) == 2 and _is_num(v[0]) and _is_num(v[1]):
-                        return v[0], v[1], k
-                    if isinstance(v, dict) and _is_num(v.get("x")) and _is_num(v.get("y")):
-                        return v.get("x"), v.get("y"), f"{k}.x,y"
-                # 4) bbox handled in process_coords separately
-                return None, None, None
-            # Lightweight visual verification helpers
-            def _norm_mean_abs_diff(a_img, b_img):
-                try:
-                    from PIL import ImageChops, ImageStat, Image
-                    if a_img.size != b_img.size:
-                        b_img = b_img.resize(a_img.size)
-                    a_g = a_img.convert("L")
-                    b_g = b_img.convert("L")
-                    diff = ImageChops.difference(a_g, b_g)
-                    stat = ImageStat.Stat(diff)
-                    # Mean absolute difference normalized to [0,1]
-                    mad = stat.mean[0] / 255.0
-                    return float(mad)
-                except Exception:
-                    return 0.0
-
-            def _cap_region(cx, cy, w, h):
-                L = max(0, int(cx - w // 2))
-                T = max(0, int(cy - h // 2))
-                R = min(actual_width, L + int(w))
-                B = min(actual_height, T + int(h))
-                W = max(1, R - L)
-                H = max(1, B - T)
-                return self.screen.capture((L, T, W, H)), (L, T, W, H)
-
-            verify_cfg = self.cfg.get("verify", {}) if isinstance(self.cfg.get("verify", {}), dict) else {}
-            verify_wait_ms = int(verify_cfg.get("wait_ms", 180))
-            def _verify_change(region, before_img, x_final, y_final):
-                time.sleep(max(0.0, verify_wait_ms/1000.0))
-                after_img = self.screen.capture(region)
-                delta = _norm_mean_abs_diff(before_img, after_img)
-
-                # Retry logic for verification
-                retry_cfg = verify_cfg.get("retry", {})
-                if delta < float(verify_cfg.get("click_delta_threshold", 0.015)) and retry_cfg.get("enabled", False):
-                    for i in range(retry_cfg.get("max_retries", 1)):
-                        # Optional: small jitter move
-                        if retry_cfg.get("jitter_px", 0) > 0 and x_final is not None and y_final is not None:
-                            jitter = retry_cfg.get("jitter_px", 3)
-                            self.input.move(x_final + jitter, y_final + jitter, duration=0.05)
-                            self.input.move(x_final, y_final, duration=0.05)
-                        
-                        time.sleep(max(0.0, verify_wait_ms/1000.0))
-                        after_img_retry = self.screen.capture(region)
-                        delta_retry = _norm_mean_abs_diff(before_img, after_img_retry)
-                        
-                        if delta_retry >= float(verify_cfg.get("click_delta_threshold", 0.015)):
-                            return delta_retry, after_img_retry, {"attempts": i + 1, "reason": "jitter"}
-                        
-                        # Optional: enlarge region
-                        if retry_cfg.get("enlarge_factor", 1.0) > 1.0:
-                            factor = retry_cfg.get("enlarge_factor", 1.5)
-                            w, h = region[2] * factor, region[3] * factor
-                            cx, cy = region[0] + region[2] // 2, region[1] + region[3] // 2
-                            enlarged_region_img, enlarged_region = _cap_region(cx, cy, w, h)
-                            
-                            time.sleep(max(0.0, verify_wait_ms/1000.0))
-                            after_enlarged_img = self.screen.capture(enlarged_region)
-                            delta_enlarged = _norm_mean_abs_diff(enlarged_region_img, after_enlarged_img)
-                            if delta_enlarged >= float(verify_cfg.get("click_delta_threshold", 0.015)):
-                                return delta_enlarged, after_enlarged_img, {"attempts": i + 1, "reason": "enlarge", "new_region": enlarged_region}
-
-                return delta, after_img, None
-
-            step_verify = None
-            # Cursor position helpers for diagnostics
-            def _cursor_pos():
-                try:
-                    import win32api  # type: ignore
-                    x, y = win32api.GetCursorPos()
-                    return int(x), int(y)
-                except Exception:
-                    try:
-                        import pyautogui as _pg
-                        x, y = _pg.position()
-                        return int(x), int(y)
-                    except Exception:
-                        return None
-
-            if act == "MOVE":
-                x_raw, y_raw, src = _extract_xy(args)
-                if x_raw is None or y_raw is None:
-                    # Default to center if not provided
-                    x_raw, y_raw, src = actual_width // 2, actual_height // 2, "default:center"
-                x_final, y_final, _clamped, step_meta = process_coords(x_raw, y_raw, args)
-                cur_before = _cursor_pos()
-                observation = self.input.move(x_final, y_final, float(args.get("duration", 0.0)))
-                cur_after = _cursor_pos()
-                step_meta = {**(step_meta or {}), "cursor": {"before": cur_before, "after": cur_after}, "coord_source": src}
-            elif act == "CLICK":
-                x_raw, y_raw, src = _extract_xy(args)
-                x_final, y_final, _clamped, step_meta = process_coords(x_raw, y_raw, args)
-                cur_before = None
-                cur_after = None
-                if x_final is None or y_final is None:
-                    observation = (
-                        f"missing coordinates; click skipped (args keys={list((args or {}).keys())}; "
-                        f"accepted: x,y | coordinates/point/position [x,y] or {{x,y}} | bbox [x1,y1,x2,y2])"
-                    )
-                    region = (0, 0, 1, 1)
-                    before_img = self.screen.capture((0, 0, 1, 1))
-                else:
-                    before_img, region = _cap_region(x_final, y_final, 140, 140)
-                    cur_before = _cursor_pos()
-                    observation = self.input.click(
-                        x_final,
-                        y_final,
-                        button=args.get("button", "left"),
-                        clicks=int(args.get("clicks", 1)),
-                        interval=float(args.get("interval", 0.1)),
-                    )
-                delta, after_img, retry_meta = _verify_change(region, before_img, x_final, y_final)
-                if overlay_enabled and x_final is not None and y_final is not None:
-                    overlay.show_crosshair(int(x_final), int(y_final), overlay_ms)
-                pass_threshold = float(verify_cfg.get("click_delta_threshold", 0.015))
-                step_verify = {"region": list(region), "delta": delta, "pass": bool(delta >= pass_threshold)}
-                if retry_meta:
-                    step_verify["retry"] = retry_meta
-                try:
-                    if bool(verify_cfg.get("save_images", True)):
-                        before_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_before.png")
-                        after_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_after.png")
-                        before_img.save(before_path)
-                        after_img.save(after_path)
-                        step_verify["images"] = {"before": before_path, "after": after_path}
-                except Exception:
-                    pass
-                # Attach cursor diagnostics if available
-                try:
-                    if cur_before is not None or cur_after is not None:
-                        step_meta = {**(step_meta or {}), "cursor": {"before": cur_before, "after": cur_after}, "coord_source": src}
-                except Exception:
-                    pass
-            elif act == "DOUBLE_CLICK":
-                x_raw, y_raw, src = _extract_xy(args)
-                x_final, y_final, _clamped, step_meta = process_coords(x_raw, y_raw, args)
-                if x_final is None or y_final is None:
-                    observation = (
-                        f"missing coordinates; double-click skipped (args keys={list((args or {}).keys())}; "
-                        f"accepted: x,y | coordinates/point/position [x,y] or {{x,y}} | bbox [x1,y1,x2,y2])"
-                    )
-                    region = (0, 0, 1, 1)
-                    before_img = self.screen.capture((0, 0, 1, 1))
-                else:
-                    before_img, region = _cap_region(x_final, y_final, 140, 140)
-                    observation = self.input.click(x_final, y_final, button=args.get("button", "left"), clicks=2, interval=0.1)
-                delta, after_img, retry_meta = _verify_change(region, before_img, x_final, y_final)
-                if overlay_enabled and x_final is not None and y_final is not None:
-                    overlay.show_crosshair(int(x_final), int(y_final), overlay_ms)
-                pass_threshold = float(verify_cfg.get("double_click_delta_threshold", 0.02))
-                step_verify = {"region": list(region), "delta": delta, "pass": bool(delta >= pass_threshold)}
-                if retry_meta:
-                    step_verify["retry"] = retry_meta
-                try:
-                    if bool(verify_cfg.get("save_images", True)):
-                        before_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_before.png")
-                        after_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_after.png")
-                        before_img.save(before_path)
-                        after_img.save(after_path)
-                        step_verify["images"] = {"before": before_path, "after": after_path}
-                except Exception:
-                    pass
-            elif act == "RIGHT_CLICK":
-                x_raw, y_raw, src = _extract_xy(args)
-                x_final, y_final, _clamped, step_meta = process_coords(x_raw, y_raw, args)
-                if x_final is None or y_final is None:
-                    observation = (
-                        f"missing coordinates; right-click skipped (args keys={list((args or {}).keys())}; "
-                        f"accepted: x,y | coordinates/point/position [x,y] or {{x,y}} | bbox [x1,y1,x2,y2])"
-                    )
-                    region = (0, 0, 1, 1)
-                    before_img = self.screen.capture((0, 0, 1, 1))
-                else:
-                    before_img, region = _cap_region(x_final, y_final, 140, 140)
-                    observation = self.input.click(x_final, y_final, button="right", clicks=1)
-                delta, after_img, retry_meta = _verify_change(region, before_img, x_final, y_final)
-                if overlay_enabled and x_final is not None and y_final is not None:
-                    overlay.show_crosshair(int(x_final), int(y_final), overlay_ms)
-                pass_threshold = float(verify_cfg.get("right_click_delta_threshold", 0.015))
-                step_verify = {"region": list(region), "delta": delta, "pass": bool(delta >= pass_threshold)}
-                if retry_meta:
-                    step_verify["retry"] = retry_meta
-                try:
-                    if bool(verify_cfg.get("save_images", True)):
-                        before_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_before.png")
-                        after_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_after.png")
-                        before_img.save(before_path)
-                        after_img.save(after_path)
-                        step_verify["images"] = {"before": before_path, "after": after_path}
-                except Exception:
-                    pass
-            elif act == "TYPE":
-                # Use a central region for a coarse visual delta since caret position is unknown
-                cx, cy = actual_width // 2, actual_height // 2
-                before_img, region = _cap_region(cx, cy, 360, 160)
-                delta, after_img, retry_meta = _verify_change(region, before_img, None, None)
-                pass_threshold = float(verify_cfg.get("type_delta_threshold", 0.01))
-                step_verify = {"region": list(region), "delta": delta, "pass": bool(delta >= pass_threshold)}
-                if retry_meta:
-                    step_verify["retry"] = retry_meta
-                try:
-                    if bool(verify_cfg.get("save_images", True)):
-                        before_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_before.png")
-                        after_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_after.png")
-                        before_img.save(before_path)
-                        after_img.save(after_path)
-                        step_verify["images"] = {"before": before_path, "after": after_path}
-                except Exception:
-                    pass
-            elif act == "HOTKEY":
-                observation = self.input.hotkey([str(k) for k in args.get("keys", [])])
-            elif act == "SCROLL":
-                # Verify on a central strip
-                cx, cy = actual_width // 2, actual_height // 2
-                before_img, region = _cap_region(cx, cy, min(600, actual_width), min(400, actual_height))
-                observation = self.input.scroll(int(args.get("amount", -600)))
-                delta, after_img, retry_meta = _verify_change(region, before_img, None, None)
-                pass_threshold = float(verify_cfg.get("scroll_delta_threshold", 0.03))
-                step_verify = {"region": list(region), "delta": delta, "pass": bool(delta >= pass_threshold)}
-                if retry_meta:
-                    step_verify["retry"] = retry_meta
-                try:
-                    if bool(verify_cfg.get("save_images", True)):
-                        before_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_before.png")
-                        after_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_after.png")
-                        before_img.save(before_path)
-                        after_img.save(after_path)
-                        step_verify["images"] = {"before": before_path, "after": after_path}
-                except Exception:
-                    pass
-            elif act == "DRAG":
-                x_raw, y_raw = args.get("x", 0), args.get("y", 0)
-                coord = args.get("coordinates") or args.get("point") or args.get("position")
-                if isinstance(coord, (list, tuple)) and len(coord) == 2:
-                    x_raw, y_raw = coord[0], coord[1]
-                x_final, y_final, _clamped, step_meta = process_coords(x_raw, y_raw, args)
-                if x_final is None or y_final is None:
-                    observation = "missing coordinates; drag skipped"
-                    region = (0, 0, 1, 1)
-                    before_img = self.screen.capture((0, 0, 1, 1))
-                else:
-                    before_img, region = _cap_region(x_final, y_final, 200, 200)
-                    observation = self.input.drag(x_final, y_final, float(args.get("duration",0.2)))
-                delta, after_img, retry_meta = _verify_change(region, before_img, x_final, y_final)
-                pass_threshold = float(verify_cfg.get("drag_delta_threshold", 0.03))
-                step_verify = {"region": list(region), "delta": delta, "pass": bool(delta >= pass_threshold)}
-                if retry_meta:
-                    step_verify["retry"] = retry_meta
-                try:
-                    if bool(verify_cfg.get("save_images", True)):
-                        before_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_before.png")
-                        after_path = os.path.join(self.run_dir, f"verify_step_{idx:04d}_after.png")
-                        before_img.save(before_path)
-                        after_img.save(after_path)
-                        step_verify["images"] = {"before": before_path, "after": after_path}
-                except Exception:
-                    pass
-            elif act == "WAIT":
-                observation = self.input.wait(float(args.get("seconds",0.5)))
-            # Phase 2 actions disabled - need implementation fixes
-            # elif act == "CLICK_TEXT":
-            #     # OCR-assisted click by visible text
-            #     try:
-            #         from tools.ocr import OCRTargeter
-            #         shot_img = pil_img
-            #         ocrc = self.cfg.get("ocr", {})
-            #         targeter = getattr(self, "_ocr_targeter", None)
-            #         if targeter is None:
-            #             targeter = self._ocr_targeter = OCRTargeter(
-            #                 language=ocrc.get("language","eng"),
-            #                 psm=int(ocrc.get("psm",6)),
-            #                 oem=int(ocrc.get("oem",3)),
-            #             )
-            #         query = str(args.get("text", "")).strip()
-            #         min_score = float(args.get("min_score", ocrc.get("min_score", 0.70)))
-            #         region = ocrc.get("region", None)
-            #         matches = targeter.find_text(
-            #             shot_img,
-            #             query,
-            #             min_score=min_score,
-            #             region=tuple(region) if region else None,
-            #         )
-            #         if matches:
-            #             top = matches[0]
-            #             cx = top.x + top.w // 2
-            #             cy = top.y + top.h // 2
-            #             observation = self.input.click(cx, cy, button="left", clicks=1, interval=0.1)
-            #             if overlay_enabled:
-            #                 overlay.show_crosshair(int(cx), int(cy), overlay_ms)
-            #         else:
-            #             observation = f"no match for text '{query}' (min_score={min_score})"
-            #     except Exception as e:
-            #         observation = f"OCR error: {e}"
-            # elif act == "UIA_INVOKE":
-            #     try:
-            #         from tools.win_uia import WinUIA
-            #         uia = getattr(self, "_uia", None)
-            #         if uia is None:
-            #             uia = self._uia = WinUIA(timeout_ms=int(self.cfg.get("windows_uia",{}).get("timeout_ms",1500)))
-            #         selector = args.get("selector", {})
-            #         scope = args.get("scope", "active_window")
-            #         found = uia.find(selector, scope=scope)
-            #         observation = "UIA_INVOKE: no matches"
-            #         if found:
-            #             ok = uia.invoke(found[0])
-            #             observation = f"UIA_INVOKE: {'ok' if ok else 'failed'}"
-            #     except Exception as e:
-            #         observation = f"UIA error: {e}"
-            # elif act == "UIA_SET_VALUE":
-            #     try:
-            #         from tools.win_uia import WinUIA
-            #         uia = getattr(self, "_uia", None)
-            #         if uia is None:
-            #             uia = self._uia = WinUIA(timeout_ms=int(self.cfg.get("windows_uia",{}).get("timeout_ms",1500)))
-            #         selector = args.get("selector", {})
-            #         value = str(args.get("value", ""))
-            #         scope = args.get("scope", "active_window")
-            #         found = uia.find(selector, scope=scope)
-            #         observation = "UIA_SET_VALUE: no matches"
-            #         if found:
-            #             ok = uia.set_value(found[0], value)
-            #             observation = f"UIA_SET_VALUE: {'ok' if ok else 'failed'}"
-            #     except Exception as e:
-            #         observation = f"UIA error: {e}"
-            elif act == "NONE":
-                observation = "no-op"
+
+            entry = action_table.get(act)
+            if entry is None:
+                observation, step_meta, step_verify = f"unknown action: {act}", None, None
             else:
-                observation = f"unknown action: {act}"
-            shot_path = self.screen.save_step_image(pil_img, idx)
+                handler, needs_xy = entry
+                ctx = _StepContext(idx, pil_img, actual_width, actual_height, scale_x, scale_y)
+                if needs_xy:
+                    ctx.xy = _extract_xy(args)
+                observation, step_meta, step_verify = handler(args, ctx)
+            last_shot = (img_jpeg, shot_path)
             # Merge verification into meta
             if step_meta is None:
                 step_meta = {}
@@ -683,23 +527,375 @@ class Stepper:
                 screenshot_path=shot_path,
                 meta=step_meta,
             )
-            self.steps.append(step)
+            step_json = step.to_json()
+            steps_append(step)
+            recent_steps_json.append(step_json)
             self.last_observation = observation
-            self._log(step.to_json())
-            print_step_table(step.to_json())
+            log(step_json)
+            print_step_table(step_json)
             if step.say:
                 say_to_user(step.say)
             if bool(payload.get("done", False)):
                 done = True
                 break
-            time.sleep(max(0, min_interval_ms/1000.0))
+            if min_interval_s:
+                remaining = deadline - monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
         say_to_user("Task complete." if done else "Stopping (max steps or user stop).")
+        # Screenshots referenced by this instruction's steps are on disk once it returns
+        self._wait_io()
         # On session end, emit error counters (if any)
         try:
             if self.error_counts:
                 self._log_debug({"type": "error_summary", "counts": self.error_counts})
-                if getattr(self, "session_log_fp", None):
-                    self.session_log_fp.write(json.dumps({"type": "error_summary", "counts": self.error_counts}) + "\n")
-                    self.session_log_fp.flush()
+                if self._session_log:
+                    self._session_log.write({"type": "error_summary", "counts": self.error_counts})
         except Exception:
             pass
+        # Make the full instruction visible to log readers once the run finishes
+        self._flush_logs()
+
+    # ------------------------------------------------------------------
+    # Coordinate helpers
+    # ------------------------------------------------------------------
+    def _clamp_to_screen(self, x, y, ctx: _StepContext):
+        """Clamp to the valid screen rectangle."""
+        if x is None or y is None:
+            return x, y, False
+        xi = int(x)
+        yi = int(y)
+        clamped_x = max(0, min(ctx.screen_w - 1, xi))
+        clamped_y = max(0, min(ctx.screen_h - 1, yi))
+        clamped = (clamped_x != xi) or (clamped_y != yi)
+        return clamped_x, clamped_y, clamped
+
+    def _process_coords(self, x_raw, y_raw, args_ref, ctx: _StepContext):
+        """Process coordinates from the model.
+
+        Supports:
+         - Absolute screen coords (default, no scaling)
+         - Normalized coords scaled to 1000 (0..1000) → screen via actual dims
+         - Bounding box [x1,y1,x2,y2] → center point (handles normalized_1000)
+        """
+        actual_width, actual_height = ctx.screen_w, ctx.screen_h
+        pil_img = ctx.image
+        coord_system = "screen_absolute"
+        bbox = None
+        bx = by = None
+        # 1) If bbox provided, compute center (normalized_1000 if values <=1000)
+        bb = args_ref.get("bbox") if args_ref else None
+        if isinstance(bb, (list, tuple)) and len(bb) == 4:
+            try:
+                x1 = float(bb[0]); y1 = float(bb[1]); x2 = float(bb[2]); y2 = float(bb[3])
+                bbox = [x1, y1, x2, y2]
+                # Same bound as max(abs(...)) <= 1000.5, as chained compares without the temporaries
+                if (-1000.5 <= x1 <= 1000.5 and -1000.5 <= y1 <= 1000.5
+                        and -1000.5 <= x2 <= 1000.5 and -1000.5 <= y2 <= 1000.5):
+                    coord_system = "normalized_1000_bbox"
+                    cx = (x1 + x2) / 2.0
+                    cy = (y1 + y2) / 2.0
+                    bx = int(round((cx / 1000.0) * actual_width))
+                    by = int(round((cy / 1000.0) * actual_height))
+                else:
+                    coord_system = "screen_bbox"
+                    bx = int(round((x1 + x2) / 2.0))
+                    by = int(round((y1 + y2) / 2.0))
+            except Exception:
+                bbox = None
+
+        # 2) Coord system hint
+        if args_ref and isinstance(args_ref.get("coord_system"), str):
+            hint = args_ref.get("coord_system").strip().lower()
+            if hint in {"normalized_1000", "normalized-1000", "norm_1000"}:
+                coord_system = "normalized_1000"
+            elif hint in {"unit_normalized", "normalized", "0_1", "[0,1]"}:
+                coord_system = "unit_normalized"
+
+        # 3) Choose source coords
+        src_x, src_y = (bx, by) if (bx is not None and by is not None) else (x_raw, y_raw)
+
+        # 4) Heuristic detect if not hinted
+        try:
+            if src_x is not None and src_y is not None and coord_system == "screen_absolute":
+                sx = float(src_x); sy = float(src_y)
+                if 0.0 <= sx <= 1.0 and 0.0 <= sy <= 1.0:
+                    coord_system = "unit_normalized"
+                elif 0.0 <= sx <= 1000.5 and 0.0 <= sy <= 1000.5:
+                    coord_system = "normalized_1000"
+        except Exception:
+            pass
+
+        # 5) Map to screen coords
+        if src_x is None or src_y is None:
+            x_final, y_final = src_x, src_y
+            clamped = False
+        else:
+            if coord_system in {"normalized_1000", "normalized_1000_bbox"}:
+                xf = int(round((float(src_x) / 1000.0) * actual_width))
+                yf = int(round((float(src_y) / 1000.0) * actual_height))
+            elif coord_system == "unit_normalized":
+                xf = int(round(float(src_x) * actual_width))
+                yf = int(round(float(src_y) * actual_height))
+            else:  # screen_absolute/screen_bbox
+                xf = int(round(float(src_x)))
+                yf = int(round(float(src_y)))
+            x_final, y_final, clamped = self._clamp_to_screen(xf, yf, ctx)
+
+        # Heuristics
+        raw_exceeds_image = False
+        try:
+            if x_raw is not None and y_raw is not None:
+                raw_exceeds_image = (float(x_raw) >= float(pil_img.width)) or (float(y_raw) >= float(pil_img.height))
+        except Exception:
+            pass
+
+        meta = {
+            "screen": {"width": actual_width, "height": actual_height},
+            "image": {"width": pil_img.width, "height": pil_img.height},
+            "coords": {"raw": [x_raw, y_raw], "final": [x_final, y_final]},
+            "bbox": bbox,
+            "scaling": {"mode": coord_system, "scale_x": ctx.scale_x, "scale_y": ctx.scale_y, "applied": coord_system != "screen_absolute"},
+            "clamped": clamped,
+            "heuristics": {"raw_exceeds_image": raw_exceeds_image},
+        }
+        return x_final, y_final, clamped, meta
+
+    # ------------------------------------------------------------------
+    # Lightweight visual verification helpers
+    # ------------------------------------------------------------------
+    def _cap_region(self, cx, cy, w, h, ctx: _StepContext):
+        L = max(0, int(cx - w // 2))
+        T = max(0, int(cy - h // 2))
+        R = min(ctx.screen_w, L + int(w))
+        B = min(ctx.screen_h, T + int(h))
+        W = max(1, R - L)
+        H = max(1, B - T)
+        return self.screen.capture((L, T, W, H)), (L, T, W, H)
+
+    def _verify_change(self, region, before_img, x_final, y_final, ctx: _StepContext):
+        verify_cfg = self._verify_cfg
+        verify_wait_s = self._verify_wait_s
+        time.sleep(verify_wait_s)
+        after_img = self.screen.capture(region)
+        delta = _norm_mean_abs_diff(before_img, after_img)
+
+        # Retry logic for verification
+        retry_cfg = verify_cfg.get("retry", {})
+        if delta < float(verify_cfg.get("click_delta_threshold", 0.015)) and retry_cfg.get("enabled", False):
+            for i in range(retry_cfg.get("max_retries", 1)):
+                # Optional: small jitter move
+                if retry_cfg.get("jitter_px", 0) > 0 and x_final is not None and y_final is not None:
+                    jitter = retry_cfg.get("jitter_px", 3)
+                    self.input.move(x_final + jitter, y_final + jitter, duration=0.05)
+                    self.input.move(x_final, y_final, duration=0.05)
+
+                time.sleep(verify_wait_s)
+                after_img_retry = self.screen.capture(region)
+                delta_retry = _norm_mean_abs_diff(before_img, after_img_retry)
+
+                if delta_retry >= float(verify_cfg.get("click_delta_threshold", 0.015)):
+                    return delta_retry, after_img_retry, {"attempts": i + 1, "reason": "jitter"}
+
+                # Optional: enlarge region
+                if retry_cfg.get("enlarge_factor", 1.0) > 1.0:
+                    factor = retry_cfg.get("enlarge_factor", 1.5)
+                    w, h = region[2] * factor, region[3] * factor
+                    cx, cy = region[0] + region[2] // 2, region[1] + region[3] // 2
+                    enlarged_region_img, enlarged_region = self._cap_region(cx, cy, w, h, ctx)
+
+                    time.sleep(verify_wait_s)
+                    after_enlarged_img = self.screen.capture(enlarged_region)
+                    delta_enlarged = _norm_mean_abs_diff(enlarged_region_img, after_enlarged_img)
+                    if delta_enlarged >= float(verify_cfg.get("click_delta_threshold", 0.015)):
+                        return delta_enlarged, after_enlarged_img, {"attempts": i + 1, "reason": "enlarge", "new_region": enlarged_region}
+
+        return delta, after_img, None
+
+    def _verify_before(self, cx, cy, w, h, ctx: _StepContext):
+        """Capture the pre-action region as (image, region), or None when verification is off."""
+        if not self._verify_enabled:
+            return None
+        return self._cap_region(cx, cy, w, h, ctx)
+
+    def _verify_after(self, before, x_final, y_final, ctx: _StepContext, threshold_key: str, threshold_default: float):
+        """Diff the region captured by _verify_before after the action; None if nothing was captured."""
+        if before is None:
+            return None
+        before_img, region = before
+        delta, after_img, retry_meta = self._verify_change(region, before_img, x_final, y_final, ctx)
+        pass_threshold = float(self._verify_cfg.get(threshold_key, threshold_default))
+        step_verify = {"region": list(region), "delta": delta, "pass": bool(delta >= pass_threshold)}
+        if retry_meta:
+            step_verify["retry"] = retry_meta
+        self._save_verify_pair(ctx.idx, before_img, after_img, step_verify)
+        return step_verify
+
+    def _save_verify_pair(self, idx: int, before_img, after_img, step_verify: dict[str, Any]):
+        """Queue the before/after crops for writing and record their paths in step_verify."""
+        if not self._save_verify:
+            return
+        try:
+            before_path = self._verify_path_fmt.format(idx, "before")
+            after_path = self._verify_path_fmt.format(idx, "after")
+            self._submit_io(_save_verify_image, before_img, before_path)
+            self._submit_io(_save_verify_image, after_img, after_path)
+            step_verify["images"] = {"before": before_path, "after": after_path}
+        except Exception:
+            pass
+
+    # ------------------------------------------------------------------
+    # Action handlers: each returns (observation, step_meta, step_verify)
+    # ------------------------------------------------------------------
+    def _do_move(self, args, ctx: _StepContext):
+        x_raw, y_raw, src = ctx.xy
+        if x_raw is None or y_raw is None:
+            # Default to center if not provided
+            x_raw, y_raw, src = ctx.screen_w // 2, ctx.screen_h // 2, "default:center"
+        x_final, y_final, _clamped, step_meta = self._process_coords(x_raw, y_raw, args, ctx)
+        cur_before = _cursor_pos()
+        (duration,) = _coerce(args, ACTION_ARG_SCHEMAS["MOVE"])
+        observation = self.input.move(x_final, y_final, duration)
+        cur_after = _cursor_pos()
+        step_meta = {**(step_meta or {}), "cursor": {"before": cur_before, "after": cur_after}, "coord_source": src}
+        return observation, step_meta, None
+
+    def _do_click(self, args, ctx: _StepContext, *, button_override=None, clicks_override=None,
+                  label="click", threshold_key="click_delta_threshold", threshold_default=0.015):
+        """CLICK, and via partial() in the action table, DOUBLE_CLICK and RIGHT_CLICK."""
+        x_raw, y_raw, src = ctx.xy
+        x_final, y_final, _clamped, step_meta = self._process_coords(x_raw, y_raw, args, ctx)
+        cur_before = None
+        cur_after = None
+        if x_final is None or y_final is None:
+            observation = (
+                f"missing coordinates; {label} skipped (args keys={list((args or {}).keys())}; "
+                f"accepted: x,y | coordinates/point/position [x,y] or {{x,y}} | bbox [x1,y1,x2,y2])"
+            )
+            before = None  # nothing was done, so there is nothing to verify
+        else:
+            before = self._verify_before(x_final, y_final, 140, 140, ctx)
+            button, clicks, interval = _coerce(args, ACTION_ARG_SCHEMAS["CLICK"])
+            cur_before = _cursor_pos()
+            observation = self.input.click(
+                x_final, y_final,
+                button=button_override or button,
+                clicks=clicks_override or clicks,
+                interval=interval,
+            )
+            cur_after = _cursor_pos()
+        step_verify = self._verify_after(before, x_final, y_final, ctx, threshold_key, threshold_default)
+        if self._loopcfg.overlay_enabled and x_final is not None and y_final is not None:
+            overlay.show_crosshair(int(x_final), int(y_final), self._loopcfg.overlay_ms)
+        # Attach cursor diagnostics if available
+        if cur_before is not None or cur_after is not None:
+            step_meta = {**(step_meta or {}), "cursor": {"before": cur_before, "after": cur_after}, "coord_source": src}
+        return observation, step_meta, step_verify
+
+    def _do_type(self, args, ctx: _StepContext):
+        # Use a central region for a coarse visual delta since caret position is unknown
+        cx, cy = ctx.screen_w // 2, ctx.screen_h // 2
+        before = self._verify_before(cx, cy, 360, 160, ctx)
+        step_verify = self._verify_after(before, None, None, ctx, "type_delta_threshold", 0.01)
+        return "", None, step_verify
+
+    def _do_hotkey(self, args, ctx: _StepContext):
+        return self.input.hotkey([str(k) for k in args.get("keys", [])]), None, None
+
+    def _do_scroll(self, args, ctx: _StepContext):
+        # Verify on a central strip
+        cx, cy = ctx.screen_w // 2, ctx.screen_h // 2
+        before = self._verify_before(cx, cy, min(600, ctx.screen_w), min(400, ctx.screen_h), ctx)
+        (amount,) = _coerce(args, ACTION_ARG_SCHEMAS["SCROLL"])
+        observation = self.input.scroll(amount)
+        step_verify = self._verify_after(before, None, None, ctx, "scroll_delta_threshold", 0.03)
+        return observation, None, step_verify
+
+    def _do_drag(self, args, ctx: _StepContext):
+        x_raw, y_raw, _src = ctx.xy
+        x_final, y_final, _clamped, step_meta = self._process_coords(x_raw, y_raw, args, ctx)
+        if x_final is None or y_final is None:
+            observation = "missing coordinates; drag skipped"
+            before = None  # nothing was done, so there is nothing to verify
+        else:
+            before = self._verify_before(x_final, y_final, 200, 200, ctx)
+            (duration,) = _coerce(args, ACTION_ARG_SCHEMAS["DRAG"])
+            observation = self.input.drag(x_final, y_final, duration)
+        step_verify = self._verify_after(before, x_final, y_final, ctx, "drag_delta_threshold", 0.03)
+        return observation, step_meta, step_verify
+
+    def _do_wait(self, args, ctx: _StepContext):
+        (seconds,) = _coerce(args, ACTION_ARG_SCHEMAS["WAIT"])
+        return self.input.wait(seconds), None, None
+
+    def _do_none(self, args, ctx: _StepContext):
+        return "no-op", None, None
+
+    # Phase 2 actions disabled - need implementation fixes
+    # def _do_click_text(self, args, ctx: _StepContext):
+    #     # OCR-assisted click by visible text
+    #     try:
+    #         from tools.ocr import OCRTargeter
+    #         shot_img = ctx.image
+    #         ocrc = self.cfg.get("ocr", {})
+    #         targeter = getattr(self, "_ocr_targeter", None)
+    #         if targeter is None:
+    #             targeter = self._ocr_targeter = OCRTargeter(
+    #                 language=ocrc.get("language","eng"),
+    #                 psm=int(ocrc.get("psm",6)),
+    #                 oem=int(ocrc.get("oem",3)),
+    #             )
+    #         query = str(args.get("text", "")).strip()
+    #         min_score = float(args.get("min_score", ocrc.get("min_score", 0.70)))
+    #         region = ocrc.get("region", None)
+    #         matches = targeter.find_text(
+    #             shot_img,
+    #             query,
+    #             min_score=min_score,
+    #             region=tuple(region) if region else None,
+    #         )
+    #         if matches:
+    #             top = matches[0]
+    #             cx = top.x + top.w // 2
+    #             cy = top.y + top.h // 2
+    #             observation = self.input.click(cx, cy, button="left", clicks=1, interval=0.1)
+    #             if self._loopcfg.overlay_enabled:
+    #                 overlay.show_crosshair(int(cx), int(cy), self._loopcfg.overlay_ms)
+    #         else:
+    #             observation = f"no match for text '{query}' (min_score={min_score})"
+    #     except Exception as e:
+    #         observation = f"OCR error: {e}"
+    #     return observation, None, None
+    # def _do_uia_invoke(self, args, ctx: _StepContext):
+    #     try:
+    #         from tools.win_uia import WinUIA
+    #         uia = getattr(self, "_uia", None)
+    #         if uia is None:
+    #             uia = self._uia = WinUIA(timeout_ms=int(self.cfg.get("windows_uia",{}).get("timeout_ms",1500)))
+    #         selector = args.get("selector", {})
+    #         scope = args.get("scope", "active_window")
+    #         found = uia.find(selector, scope=scope)
+    #         observation = "UIA_INVOKE: no matches"
+    #         if found:
+    #             ok = uia.invoke(found[0])
+    #             observation = f"UIA_INVOKE: {'ok' if ok else 'failed'}"
+    #     except Exception as e:
+    #         observation = f"UIA error: {e}"
+    #     return observation, None, None
+    # def _do_uia_set_value(self, args, ctx: _StepContext):
+    #     try:
+    #         from tools.win_uia import WinUIA
+    #         uia = getattr(self, "_uia", None)
+    #         if uia is None:
+    #             uia = self._uia = WinUIA(timeout_ms=int(self.cfg.get("windows_uia",{}).get("timeout_ms",1500)))
+    #         selector = args.get("selector", {})
+    #         value = str(args.get("value", ""))
+    #         scope = args.get("scope", "active_window")
+    #         found = uia.find(selector, scope=scope)
+    #         observation = "UIA_SET_VALUE: no matches"
+    #         if found:
+    #             ok = uia.set_value(found[0], value)
+    #             observation = f"UIA_SET_VALUE: {'ok' if ok else 'failed'}"
+    #     except Exception as e:
+    #         observation = f"UIA error: {e}"
+    #     return observation, None, None
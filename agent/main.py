@@ -1,18 +1,15 @@
 from __future__ import annotations
 # Environment: managed with 'uv' (https://github.com/astral-sh/uv). See README for setup.
-import argparse, os, sys, yaml
+# Heavy imports (yaml, rich, adapters, loop) are deferred into the functions that need them so --help stays instant.
+import argparse, os, sys
 from datetime import datetime, timezone
-from dotenv import load_dotenv
-from rich.console import Console
-from agent.model import get_adapter
-from agent.loop import Stepper
-
-# Load environment variables from .env file
-load_dotenv()
 
 def load_config(path: str) -> dict:
+    import yaml
+    # libyaml's C loader when PyYAML was built with it; same safe semantics as yaml.safe_load
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     with open(path, "r", encoding="utf-8") as fp:
-        return yaml.safe_load(fp)
+        return yaml.load(fp, Loader=loader)
 
 def create_run_dir() -> str:
     ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
@@ -24,6 +21,13 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", default="config.yaml")
     args = parser.parse_args()
+    # Load environment variables from .env file
+    from dotenv import load_dotenv
+    load_dotenv()
+    from rich.console import Console
+
+    from agent.loop import Stepper
+    from agent.model import get_adapter
     console = Console()
     cfg = load_config(args.config)
     adapter = get_adapter(cfg.get("provider","openai"), cfg.get("model","gpt-5.1-thinking"), float(cfg.get("temperature",0.2)), int(cfg.get("max_output_tokens",800)))
@@ -1,75 +1,230 @@
 from __future__ import annotations
 # Environment: managed with 'uv' (https://github.com/astral-sh/uv). See README for setup.
+import base64
+import functools
+import importlib.util
 import os
-from typing import Any, Dict, List, Optional
-try:
-    from dotenv import load_dotenv  # type: ignore
-    load_dotenv()
-except Exception:
-    pass
+from contextlib import suppress
+from typing import Any, Dict, List
+from agent import fastjson
+from agent.fastjson import JsonlWriter
+from agent.llm_cache import LLMCache
+from agent.parser import ACTIONS
+from tools.screen import image_mime
+
+# Screenshots reach adapters as raw JPEG (or WebP) bytes from Screen.capture_jpeg; a
+# data:image/...;base64 URL is still accepted. Each adapter converts to its own wire format.
+ImageInput = bytes | str | None
+
+
+# (jpeg bytes object, its base64 text). Screen.capture_jpeg returns the very same bytes object
+# for an unchanged frame, so an identity check lets repeated screenshots skip re-encoding.
+_last_b64: tuple[bytes | None, str] = (None, "")
+
+
+def _image_b64(image: bytes | str) -> str:
+    global _last_b64
+    if isinstance(image, str):
+        return image.split(",", 1)[1] if image.startswith("data:") else image
+    last = _last_b64
+    if image is last[0]:
+        return last[1]
+    b64 = base64.b64encode(image).decode("ascii")
+    if isinstance(image, bytes):  # immutable, so identity implies same content
+        _last_b64 = (image, b64)
+    return b64
+
+
+def _image_data_url(image: bytes | str) -> str:
+    if isinstance(image, str) and image.startswith("data:"):
+        return image
+    return f"data:{_image_mime(image)};base64," + _image_b64(image)
+
+
+def _image_mime(image: bytes | str) -> str:
+    if isinstance(image, str):
+        return image[5:image.index(";")] if image.startswith("data:") else "image/jpeg"
+    return image_mime(image)
+
+
+def _image_bytes(image: bytes | str) -> bytes:
+    if isinstance(image, str):
+        return base64.b64decode(_image_b64(image))
+    return bytes(image)
+
+
+# Prompt and schema text is fixed for the session; adapters reference these rather than
+# rebuilding them per step, which also keeps the request prefix stable for provider-side caching.
+# Same action list the parser validates against, so the schema enum cannot drift from it
+_STEP_ACTIONS = list(ACTIONS)
+
+_STEP_SCHEMA = {
+    "name": "desktop_step",
+    "schema": {
+        "type": "object",
+        "properties": {
+            "plan": {"type": "string"},
+            "say": {"type": "string"},
+            "next_action": {"type": "string", "enum": _STEP_ACTIONS},
+            "args": {"type": "object"},
+            "done": {"type": "boolean"}
+        },
+        "required": ["plan","next_action","args","done"],
+        "additionalProperties": False
+    }
+}
+
+_OPENAI_SYSTEM_PROMPT = (
+    "You are DesktopOps: a careful, step-by-step desktop operator. "
+    "Return ONLY a single JSON object with keys: plan, say, next_action, args, done. No prose or code fences. "
+    "next_action must be one of: MOVE, CLICK, DOUBLE_CLICK, RIGHT_CLICK, TYPE, HOTKEY, SCROLL, DRAG, WAIT, NONE, CLICK_TEXT, UIA_INVOKE, UIA_SET_VALUE. "
+    "If the task is complete, you MUST set {\"next_action\":\"NONE\",\"done\":true}. Do not use DONE. "
+    "If OCR is not available, do not use CLICK_TEXT. "
+    "Keep 'plan' concise (<=80 chars). Use absolute screen coordinates for pointer actions when needed."
+)
+
+_ZHIPU_SYSTEM_PROMPT = (
+    "You are DesktopOps: a careful, step-by-step desktop operator. "
+    "Return ONLY a valid JSON object (no markdown fences) with these exact keys: plan, say, next_action, args, done. "
+    "next_action must be one of: MOVE, CLICK, DOUBLE_CLICK, RIGHT_CLICK, TYPE, HOTKEY, SCROLL, DRAG, WAIT, NONE, CLICK_TEXT, UIA_INVOKE, UIA_SET_VALUE. "
+    "If the task is complete, you MUST set {\"next_action\":\"NONE\",\"done\":true}. Do not use DONE. "
+    "args must be a JSON object. done must be boolean. Keep 'plan' concise (<=80 chars). "
+    "IMPORTANT: Only use CLICK_TEXT if OCR is explicitly available in the user's message. If OCR is not available, never use CLICK_TEXT; instead, use CLICK with explicit absolute screen coordinates. "
+    "When using pointer actions (MOVE/CLICK/DOUBLE_CLICK/RIGHT_CLICK/DRAG), you must return ABSOLUTE screen coordinates in the current screen space."
+)
+
+# Zhipu's system prompt; a reply cut off at the token limit is reissued once with a larger budget
+_ZHIPU_COMPACT_SYSTEM_PROMPT = (
+    _ZHIPU_SYSTEM_PROMPT
+    + "\nReturn a COMPACT JSON object: no markdown, no prose, no newlines, no spaces after colons/commas. "
+    + "Only keys: plan,say,next_action,args,done. Keep plan<=40 chars. Use integers for coordinates."
+)
+
+_ANTHROPIC_SYSTEM_PROMPT = "You are DesktopOps, return strictly the specified JSON."
+
+_JSON_ONLY_INSTRUCTIONS = (
+    "Return ONLY a single JSON object with keys: plan,say,next_action,args,done. No prose. "
+    "If done, set next_action:'NONE' and done:true. Do not use DONE. If OCR is not available, do not use CLICK_TEXT."
+)
+
+
+# Steps of history sent with each model call; the Stepper keeps no more than this for the adapters
+MODEL_HISTORY_STEPS = 6
+
+
+def _recent_steps_text(recent_steps) -> str:
+    """History tail for the prompt as compact JSON, which tokenizes shorter than a Python repr."""
+    return fastjson.dumps_str(list(recent_steps)[-MODEL_HISTORY_STEPS:]) if recent_steps else "[]"
+
+
+@functools.cache
+def _load_env() -> None:
+    """Read .env once, on first provider construction rather than at import (keys are read in __init__)."""
+    with suppress(Exception):
+        from dotenv import load_dotenv  # type: ignore
+        load_dotenv()
+
+
+# HTTP/2 is only negotiated when the optional 'h2' package is installed; httpx raises otherwise.
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+def _http_client(sdk):
+    """SDK-default http client whose idle connections outlive a step (the SDK default drops them after 5s)."""
+    default = sdk.DEFAULT_CONNECTION_LIMITS
+    limits = type(default)(max_connections=default.max_connections, max_keepalive_connections=8, keepalive_expiry=60.0)
+    return sdk.DefaultHttpxClient(http2=_HTTP2, limits=limits)
+
+
+class _UncachedReply(str):
+    """A reply text adapters return for a fallback (e.g. after a provider error); _cached_step never stores it."""
+    __slots__ = ()
+
+
+def _cached_step(step):
+    """Serve repeat calls from self._cache (set only at temperature 0).
+
+    Replies marked _UncachedReply are not stored. The adapter cannot tell whether the caller will accept a
+    reply, so a caller that rejects one drops it again with discard_cached_reply().
+    """
+    @functools.wraps(step)
+    def wrapper(self, instruction, last_observation, recent_steps, image_b64_jpeg):
+        cache = self._cache
+        if cache is None:
+            return step(self, instruction, last_observation, recent_steps, image_b64_jpeg)
+        key = self._last_cache_key = cache.key(instruction, recent_steps, image_b64_jpeg)
+        hit = cache.get(key)
+        if hit is not None:
+            log_provider = getattr(self, "_log_provider", None)
+            if log_provider is not None:
+                log_provider({"type": "provider_cache_hit", **cache.stats})
+            return hit
+        out = step(self, instruction, last_observation, recent_steps, image_b64_jpeg)
+        if out and not isinstance(out, _UncachedReply):
+            cache.set(key, out)
+        return out
+    return wrapper
+
 
 class BaseModelAdapter:
+    # Reply cache; adapters create one in __init__ when temperature is 0 (see _cached_step)
+    _cache: LLMCache | None = None
+    _last_cache_key: str | None = None
+
     def step(self, instruction: str, last_observation: str, recent_steps: List[Dict[str, Any]],
-             image_b64_jpeg: Optional[str]) -> Dict[str, Any]:
+             image_b64_jpeg: ImageInput) -> Dict[str, Any]:
+        # recent_steps is the serialized tail of the Stepper's history (at most MODEL_HISTORY_STEPS), oldest first
         raise NotImplementedError
 
+    def discard_cached_reply(self):
+        """Forget the reply the last step() stored or served, e.g. because the caller could not parse it."""
+        if self._cache is not None and self._last_cache_key is not None:
+            self._cache.discard(self._last_cache_key)
+
+    def close(self):
+        """Release pooled provider connections. The SDK client is reused for every step, so
+        keep-alive connections stay open across calls until this runs."""
+        client = getattr(self, "client", None)
+        closer = getattr(client, "close", None)
+        if callable(closer):
+            closer()
+
 
 
 class OpenAIAdapter(BaseModelAdapter):
     def __init__(self, model: str, temperature: float, max_output_tokens: int):
-        from openai import OpenAI
+        _load_env()
+        import openai
         base_url = os.environ.get("OPENAI_BASE_URL")
-        self.client = OpenAI(
+        self.client = openai.OpenAI(
             api_key=os.environ.get("OPENAI_API_KEY"),
-            base_url=base_url if base_url else None
+            base_url=base_url if base_url else None,
+            http_client=_http_client(openai),
         )
         self.model = model
         self.temperature = temperature
         self.max_output_tokens = max_output_tokens
+        self._cache = LLMCache(f"openai:{model}") if temperature == 0 else None
+        # Static request envelope: built once so every call sends a byte-identical prefix
+        self._system_msg = {"role": "system", "content": _OPENAI_SYSTEM_PROMPT}
+        self._response_format = {"type": "json_schema", "json_schema": _STEP_SCHEMA}
 
+    @_cached_step
     def step(self, instruction: str, last_observation: str, recent_steps, image_b64_jpeg):
-        system_prompt = (
-            "You are DesktopOps: a careful, step-by-step desktop operator. "
-            "Return ONLY a single JSON object with keys: plan, say, next_action, args, done. No prose or code fences. "
-            "next_action must be one of: MOVE, CLICK, DOUBLE_CLICK, RIGHT_CLICK, TYPE, HOTKEY, SCROLL, DRAG, WAIT, NONE, CLICK_TEXT, UIA_INVOKE, UIA_SET_VALUE. "
-            "If the task is complete, you MUST set {\"next_action\":\"NONE\",\"done\":true}. Do not use DONE. "
-            "If OCR is not available, do not use CLICK_TEXT. "
-            "Keep 'plan' concise (<=80 chars). Use absolute screen coordinates for pointer actions when needed."
-        )
         messages = [
-            {"role": "system", "content": system_prompt},
+            self._system_msg,
             {"role": "user", "content": [
-                {"type": "text", "text": f"Instruction: {instruction}\nLast observation: {last_observation}\nRecent steps: {recent_steps[-6:] if recent_steps else []}\nRespond with required JSON only."}
+                {"type": "text", "text": f"Instruction: {instruction}\nLast observation: {last_observation}\nRecent steps: {_recent_steps_text(recent_steps)}\nRespond with required JSON only."}
             ]}
         ]
         if image_b64_jpeg:
-            messages[1]["content"].append({"type": "image_url", "image_url": {"url": image_b64_jpeg}})
-
-        schema = {
-            "name": "desktop_step",
-            "schema": {
-                "type": "object",
-                "properties": {
-                    "plan": {"type": "string"},
-                    "say": {"type": "string"},
-                    "next_action": {"type": "string",
-                        "enum": [
-                            "MOVE","CLICK","DOUBLE_CLICK","RIGHT_CLICK","TYPE","HOTKEY",
-                            "SCROLL","DRAG","WAIT","NONE",
-                            "CLICK_TEXT","UIA_INVOKE","UIA_SET_VALUE"
-                        ]},
-                    "args": {"type": "object"},
-                    "done": {"type": "boolean"}
-                },
-                "required": ["plan","next_action","args","done"],
-                "additionalProperties": False
-            }
-        }
+            messages[1]["content"].append({"type": "image_url", "image_url": {"url": _image_data_url(image_b64_jpeg)}})
+
         resp = self.client.chat.completions.create(
             model=self.model,
             temperature=self.temperature,
             messages=messages,
-            response_format={"type": "json_schema", "json_schema": schema},
+            response_format=self._response_format,
             max_tokens=self.max_output_tokens,
         )
         m = resp.choices[0].message
@@ -77,30 +232,48 @@ class OpenAIAdapter(BaseModelAdapter):
 
 class AnthropicAdapter(BaseModelAdapter):
     def __init__(self, model: str, temperature: float, max_output_tokens: int):
+        _load_env()
         import anthropic
-        self.client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+        self.client = anthropic.Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"), http_client=_http_client(anthropic))
         self.model = model
         self.temperature = temperature
         self.max_output_tokens = max_output_tokens
+        self._cache = LLMCache(f"anthropic:{model}") if temperature == 0 else None
+        self._instructions_part = {"type": "text", "text": _JSON_ONLY_INSTRUCTIONS}
+        # Forced tool call: the reply arrives as an already-parsed dict matching the step schema
+        self._tools = [{
+            "name": _STEP_SCHEMA["name"],
+            "description": "Report the next desktop step.",
+            "input_schema": _STEP_SCHEMA["schema"],
+        }]
+        self._tool_choice = {"type": "tool", "name": _STEP_SCHEMA["name"]}
 
+    @_cached_step
     def step(self, instruction: str, last_observation: str, recent_steps, image_b64_jpeg):
-        content = [{"type": "text", "text": (
-            "Return ONLY a single JSON object with keys: plan,say,next_action,args,done. No prose. "
-            "If done, set next_action:'NONE' and done:true. Do not use DONE. If OCR is not available, do not use CLICK_TEXT."
-        )}]
+        content = [self._instructions_part]
         if image_b64_jpeg:
-            import base64
-            content.append({"type":"image", "source": {"type":"base64","media_type":"image/jpeg","data": image_b64_jpeg.split(",")[1]}})
-        content.append({"type":"text","text": f"Instruction: {instruction}\nLast observation: {last_observation}\nRecent steps: {recent_steps[-6:] if recent_steps else []}"})
+            content.append({"type":"image", "source": {"type":"base64","media_type": _image_mime(image_b64_jpeg),"data": _image_b64(image_b64_jpeg)}})
+        content.append({"type":"text","text": f"Instruction: {instruction}\nLast observation: {last_observation}\nRecent steps: {_recent_steps_text(recent_steps)}"})
         msg = self.client.messages.create(
             model=self.model,
             temperature=self.temperature,
             max_tokens=self.max_output_tokens,
-            system="You are DesktopOps, return strictly the specified JSON.",
+            system=_ANTHROPIC_SYSTEM_PROMPT,
             messages=[{"role":"user","content": content}],
+            tools=self._tools,
+            tool_choice=self._tool_choice,
         )
+        for block in msg.content:
+            if getattr(block, "type", None) == "tool_use":
+                return block.input
         return msg.content[0].text
 
+# Returned by ZhipuAdapter when every attempt failed
+_ZHIPU_FALLBACK_REPLY = _UncachedReply(
+    '{"plan":"handle provider error","say":"Temporary provider error; please retry.",'
+    '"next_action":"NONE","args":{},"done":false}'
+)
+
 class ZhipuAdapter(BaseModelAdapter):
     """Z.ai (Zhipu) adapter - use GLM-4.5V for vision support.
     
@@ -108,18 +281,26 @@ class ZhipuAdapter(BaseModelAdapter):
     DO NOT change this to /api/paas/v4 - the /coding/ path is required!
     """
     def __init__(self, model: str, temperature: float, max_output_tokens: int):
-        from openai import OpenAI
+        _load_env()
+        import openai
         # DO NOT MODIFY: This specific endpoint is required for Z.ai API access
         base_url = os.environ.get("ZHIPU_BASE_URL", "https://api.z.ai/api/coding/paas/v4")
-        self.client = OpenAI(
+        self.client = openai.OpenAI(
             api_key=os.environ.get("ZHIPU_API_KEY"),
             base_url=base_url,
+            http_client=_http_client(openai),
         )
+        # Resolved once; logged as a plain string with every provider call
+        self._endpoint_base = base_url
         self.model = model
         self.temperature = temperature
         self.max_output_tokens = max_output_tokens
+        self._cache = LLMCache(f"zhipu:{model}") if temperature == 0 else None
+        # Compact output is asked for up front: fewer output tokens per step and fewer truncations
+        self._compact_system_msg = {"role": "system", "content": _ZHIPU_COMPACT_SYSTEM_PROMPT}
         # Provider-level structured logging to current run dir if available
         self._provider_log_path = None
+        self._provider_log: JsonlWriter | None = None
         self._call_seq = 0
         try:
             debug_dir = os.environ.get("DESKTOPOPS_DEBUG_DIR")
@@ -142,60 +323,61 @@ class ZhipuAdapter(BaseModelAdapter):
         try:
             if not self._provider_log_path:
                 return
-            import json as _json
-            with open(self._provider_log_path, "a", encoding="utf-8") as fp:
-                fp.write(_json.dumps(obj, ensure_ascii=False) + "\n")
+            writer = self._provider_log
+            if writer is None or writer.path != self._provider_log_path:
+                # Kept open and buffered across calls; reopened only when the run directory changes
+                if writer is not None:
+                    writer.close()
+                writer = self._provider_log = JsonlWriter(self._provider_log_path)
+            writer.write(obj)
         except Exception:
             pass
 
-    def step(self, instruction: str, last_observation: str, recent_steps, image_b64_jpeg):
-        system_prompt = (
-            "You are DesktopOps: a careful, step-by-step desktop operator. "
-            "Return ONLY a valid JSON object (no markdown fences) with these exact keys: plan, say, next_action, args, done. "
-            "next_action must be one of: MOVE, CLICK, DOUBLE_CLICK, RIGHT_CLICK, TYPE, HOTKEY, SCROLL, DRAG, WAIT, NONE, CLICK_TEXT, UIA_INVOKE, UIA_SET_VALUE. "
-            "If the task is complete, you MUST set {\"next_action\":\"NONE\",\"done\":true}. Do not use DONE. "
-            "args must be a JSON object. done must be boolean. Keep 'plan' concise (<=80 chars). "
-            "IMPORTANT: Only use CLICK_TEXT if OCR is explicitly available in the user's message. If OCR is not available, never use CLICK_TEXT; instead, use CLICK with explicit absolute screen coordinates. "
-            "When using pointer actions (MOVE/CLICK/DOUBLE_CLICK/RIGHT_CLICK/DRAG), you must return ABSOLUTE screen coordinates in the current screen space."
-        )
+    def close(self):
+        with suppress(Exception):
+            if self._provider_log is not None:
+                self._provider_log.close()
+        super().close()
 
-        user_content = f"Instruction: {instruction}\nLast observation: {last_observation}\nRecent steps: {recent_steps[-6:] if recent_steps else []}\nRespond with the required JSON object."
+    @_cached_step
+    def step(self, instruction: str, last_observation: str, recent_steps, image_b64_jpeg):
+        user_content = f"Instruction: {instruction}\nLast observation: {last_observation}\nRecent steps: {_recent_steps_text(recent_steps)}\nRespond with the required JSON object."
+        image_url = _image_data_url(image_b64_jpeg) if image_b64_jpeg else None
 
         # Z.ai API - use GLM-4.5V for vision support
         messages = [
-            {"role": "system", "content": system_prompt},
+            self._compact_system_msg,
             {"role": "user", "content": user_content}
         ]
 
         # GLM-4.5V supports multimodal vision
-        if image_b64_jpeg:
+        if image_url:
             messages[1]["content"] = [
                 {"type": "text", "text": user_content},
-                {"type": "image_url", "image_url": {"url": image_b64_jpeg}}
+                {"type": "image_url", "image_url": {"url": image_url}}
             ]
 
         # Simple retry loop with bounded attempts + diagnostics
         import time as _time
-        import traceback as _tb
         self._call_seq += 1
+        # Input diagnostics (redacted); identical for every attempt
+        has_img = bool(image_url)
+        img_len = len(image_url) if has_img else 0
+        img_b64_bytes = 0
+        try:
+            if has_img and "," in image_url:
+                img_b64_bytes = len(image_url) - image_url.index(",") - 1
+        except Exception:
+            img_b64_bytes = 0
         for attempt in range(3):
             try:
                 t0 = _time.perf_counter()
-                # Input diagnostics (redacted)
-                has_img = bool(image_b64_jpeg)
-                img_len = len(image_b64_jpeg) if has_img else 0
-                img_b64_bytes = 0
-                try:
-                    if has_img and "," in image_b64_jpeg:
-                        img_b64_bytes = len(image_b64_jpeg.split(",", 1)[1])
-                except Exception:
-                    img_b64_bytes = 0
                 self._log_provider({
                     "type": "provider_call",
                     "provider": "zhipu",
                     "seq": self._call_seq,
                     "attempt": attempt + 1,
-                    "endpoint_base": getattr(self.client, "base_url", None) or os.environ.get("ZHIPU_BASE_URL"),
+                    "endpoint_base": self._endpoint_base,
                     "model": self.model,
                     "temperature": self.temperature,
                     "max_tokens": self.max_output_tokens,
@@ -241,35 +423,21 @@ class ZhipuAdapter(BaseModelAdapter):
                     "usage": usage,
                     "message_preview": (m.content if isinstance(m.content, str) else str(m.content))[:800],
                 })
-                # If the model hit the length limit or appears truncated, reissue once with a compact JSON constraint
+                # If the model hit the length limit or appears truncated, reissue once with a larger budget
                 try:
                     content_str = m.content if isinstance(m.content, str) else str(m.content)
                 except Exception:
                     content_str = ""
                 is_truncated = (finish_reason == "length") or (content_str and not content_str.strip().endswith("}"))
                 if is_truncated and attempt == 0:
-                    compact_system = (
-                        system_prompt
-                        + "\nReturn a COMPACT JSON object: no markdown, no prose, no newlines, no spaces after colons/commas. "
-                        + "Only keys: plan,say,next_action,args,done. Keep plan<=40 chars. Use integers for coordinates."
-                    )
-                    compact_messages = [
-                        {"role": "system", "content": compact_system},
-                        {"role": "user", "content": user_content},
-                    ]
-                    if image_b64_jpeg:
-                        compact_messages[1]["content"] = [
-                            {"type": "text", "text": user_content},
-                            {"type": "image_url", "image_url": {"url": image_b64_jpeg}},
-                        ]
-                    # Slightly increase max tokens but keep bounded
+                    # Same (already compact) messages; slightly increase max tokens but keep bounded
                     compact_max = min(int(self.max_output_tokens) + 512, 2048)
                     compact_temp = max(0.0, float(self.temperature) - 0.1)
                     t1 = _time.perf_counter()
                     resp2 = self.client.chat.completions.create(
                         model=self.model,
                         temperature=compact_temp,
-                        messages=compact_messages,
+                        messages=messages,
                         max_tokens=compact_max,
                         timeout=30,
                     )
@@ -293,15 +461,19 @@ class ZhipuAdapter(BaseModelAdapter):
                     })
                     return m2.content
                 return content_str
-            except Exception:  # network/timeouts/rate limits
-                err_txt = _tb.format_exc(limit=2)
-                self._log_provider({
+            except Exception as e:  # network/timeouts/rate limits
+                record = {
                     "type": "provider_error",
                     "provider": "zhipu",
                     "seq": self._call_seq,
                     "attempt": attempt + 1,
-                    "error": err_txt[:1200],
-                })
+                    "error": f"{type(e).__name__}: {e}"[:1200],
+                    "line": e.__traceback__.tb_lineno if e.__traceback__ else None,
+                }
+                if os.environ.get("DESKTOPOPS_DEBUG_TRACEBACK"):
+                    import traceback
+                    record["traceback"] = traceback.format_exc(limit=2)[:1200]
+                self._log_provider(record)
                 _time.sleep(0.5 * (attempt + 1))
         # Fallback payload if all attempts failed
         self._log_provider({
@@ -310,31 +482,30 @@ class ZhipuAdapter(BaseModelAdapter):
             "seq": self._call_seq,
             "attempts": 3,
         })
-        return (
-            '{"plan":"handle provider error","say":"Temporary provider error; please retry.",'
-            '"next_action":"NONE","args":{},"done":false}'
-        )
+        return _ZHIPU_FALLBACK_REPLY
 
 class GeminiAdapter(BaseModelAdapter):
     def __init__(self, model: str, temperature: float, max_output_tokens: int):
+        _load_env()
         import google.generativeai as genai
         genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
         self.model = genai.GenerativeModel(model_name=model)
         self.temperature = temperature
         self.max_output_tokens = max_output_tokens
+        self._cache = LLMCache(f"gemini:{model}") if temperature == 0 else None
 
+    @_cached_step
     def step(self, instruction: str, last_observation: str, recent_steps, image_b64_jpeg):
         parts = [
-            "Return ONLY a single JSON object with keys: plan,say,next_action,args,done. No prose. If done, set next_action:'NONE' and done:true. Do not use DONE. If OCR is not available, do not use CLICK_TEXT.",
+            _JSON_ONLY_INSTRUCTIONS,
             f"Instruction: {instruction}",
             f"Last observation: {last_observation}",
-            f"Recent steps: {recent_steps[-6:] if recent_steps else []}",
+            f"Recent steps: {_recent_steps_text(recent_steps)}",
         ]
         imgs = []
         if image_b64_jpeg:
-            import base64
-            imgs = [{"mime_type":"image/jpeg","data": base64.b64decode(image_b64_jpeg.split(",")[1])}]
-        resp = self.model.generate_content(parts + imgs, generation_config={"temperature": self.temperature, "max_output_tokens": self.max_output_tokens})
+            imgs = [{"mime_type": _image_mime(image_b64_jpeg),"data": _image_bytes(image_b64_jpeg)}]
+        resp = self.model.generate_content(parts + imgs, generation_config={"temperature": self.temperature, "max_output_tokens": self.max_output_tokens, "response_mime_type": "application/json"})
         return resp.text
 
 class DummyAdapter(BaseModelAdapter):
@@ -364,15 +535,18 @@ class DummyAdapter(BaseModelAdapter):
             "done": True,
         }
 
+_ADAPTERS = {
+    "openai": OpenAIAdapter,
+    "anthropic": AnthropicAdapter,
+    "gemini": GeminiAdapter,
+    "zhipu": ZhipuAdapter,
+}
+
+
 def get_adapter(provider: str, model: str, temperature: float, max_output_tokens: int) -> BaseModelAdapter:
     if provider == "dummy":
         return DummyAdapter()
-    if provider == "openai":
-        return OpenAIAdapter(model, temperature, max_output_tokens)
-    if provider == "anthropic":
-        return AnthropicAdapter(model, temperature, max_output_tokens)
-    if provider == "gemini":
-        return GeminiAdapter(model, temperature, max_output_tokens)
-    if provider == "zhipu":
-        return ZhipuAdapter(model, temperature, max_output_tokens)
-    raise ValueError(f"Unknown provider: {provider}")
+    factory = _ADAPTERS.get(provider)
+    if factory is None:
+        raise ValueError(f"Unknown provider: {provider}")
+    return factory(model, temperature, max_output_tokens)
@@ -1,11 +1,11 @@
 from __future__ import annotations
 # Environment: managed with 'uv' (https://github.com/astral-sh/uv). See README for setup.
-import json
-import re
 from typing import Any, Dict, Tuple
+from agent import fastjson
 
-# Public action set used across the app; OCR/Text actions are gated at runtime
-ALLOWED_ACTIONS = {
+# Public action set used across the app; OCR/Text actions are gated at runtime.
+# ACTIONS keeps a stable order for provider schemas (agent.model); ALLOWED_ACTIONS is for lookups.
+ACTIONS = (
     "NONE",
     "MOVE",
     "CLICK",
@@ -20,29 +20,26 @@ ALLOWED_ACTIONS = {
     "CLICK_TEXT",
     "UIA_INVOKE",
     "UIA_SET_VALUE",
-}
+)
+ALLOWED_ACTIONS = frozenset(ACTIONS)
+# Pointer actions and the argument keys that can carry their target
+_POINTER_ACTIONS = frozenset({"MOVE", "CLICK", "DOUBLE_CLICK", "RIGHT_CLICK", "DRAG"})
+_COORD_KEYS = ("x", "y", "cx", "cy", "bbox", "coordinates", "point", "position", "center", "target", "location")
 
-# Known wrappers and prefaces frequently produced by providers
-WRAPPER_PATTERNS = [
-    r"^<\|begin_of_box\|>\s*", r"\s*<\|end_of_box\|>$",  # GLM wrapper
-    r"^```(?:json)?\s*", r"\s*```$",                      # fences
-    r"^\s*(?:Here is the JSON:?|Output:?|Result:?)[\s\n]*",  # prefaces
-    r"^\s*Here is the JSON output:\s*",
-    r"^\s*Sure, here is the JSON:\s*",
-]
-ZERO_WIDTH = r"[\u200B-\u200D\uFEFF]"  # BOM/zero-width chars
+# Providers wrap the object in GLM box tokens (<|begin_of_box|>...<|end_of_box|>), ``` fences or a
+# preface such as "Here is the JSON:". None of these contain braces, so slicing from the first '{'
+# to the last '}' drops them all without matching each one.
+_ZERO_WIDTH = dict.fromkeys((0x200B, 0x200C, 0x200D, 0xFEFF))  # BOM/zero-width chars, for str.translate
 
 
 def clean_model_text(s: str) -> str:
     """Remove provider wrappers, code fences, zero-width chars; trim to first {...} block."""
-    s = re.sub(ZERO_WIDTH, "", s or "")
-    for pat in WRAPPER_PATTERNS:
-        s = re.sub(pat, "", s, flags=re.IGNORECASE | re.DOTALL)
-    # Trim to first JSON object if extra prose remains
-    m = re.search(r"\{.*\}", s, flags=re.DOTALL)
-    if not m:
+    s = (s or "").translate(_ZERO_WIDTH)
+    start = s.find("{")
+    end = s.rfind("}")
+    if start < 0 or end < start:
         raise ValueError("No JSON object found in the model output")
-    return m.group(0)
+    return s[start:end + 1]
 
 
 def _validate_schema_root(d: Any) -> Dict[str, Any]:
@@ -59,25 +56,25 @@ def validate_payload(d: Dict[str, Any], *, ocr_enabled: bool) -> Dict[str, Any]:
     """Contract checks independent of provider; raises ValueError with crisp messages."""
     d = _validate_schema_root(d)
 
+    na = d.get("next_action")
     # Legacy keyword should be rejected loudly so it shows in logs/tests
-    if d.get("next_action") == "DONE":
+    if na == "DONE":
         raise ValueError('Invalid next_action: DONE (use {"next_action":"NONE","done":true})')
 
     # Feature gating (check as early as possible to give crisp errors)
-    na_early = d.get("next_action")
-    if not ocr_enabled and na_early == "CLICK_TEXT":
+    if not ocr_enabled and na == "CLICK_TEXT":
         raise ValueError("CLICK_TEXT not allowed when OCR is disabled")
 
     # Minimal required keys for normal flow
     if "next_action" not in d or "done" not in d:
         raise ValueError("Missing required keys: next_action, done")
 
-    if d.get("done") is True:
-        if d.get("next_action") != "NONE":
+    if d["done"] is True:
+        if na != "NONE":
             raise ValueError('When done:true, next_action must be "NONE"')
         return d
 
-    na = str(d.get("next_action")) if d.get("next_action") is not None else None
+    na = str(na) if na is not None else None
     if na not in ALLOWED_ACTIONS:
         raise ValueError(f"Invalid next_action: {na}")
 
@@ -86,9 +83,9 @@ def validate_payload(d: Dict[str, Any], *, ocr_enabled: bool) -> Dict[str, Any]:
         raise ValueError("CLICK_TEXT not allowed when OCR is disabled")
 
     # Pointer actions must have usable coordinates
-    if na in {"MOVE", "CLICK", "DOUBLE_CLICK", "RIGHT_CLICK", "DRAG"}:
+    if na in _POINTER_ACTIONS:
         args = d.get("args", {})
-        has_coords = any(k in args for k in ["x", "y", "cx", "cy", "bbox", "coordinates", "point", "position", "center", "target", "location"])
+        has_coords = any(k in args for k in _COORD_KEYS)
         if not has_coords:
             raise ValueError(
                 f"Pointer action '{na}' requires usable coordinates. "
@@ -103,19 +100,30 @@ def parse_step(raw_text: str, *, ocr_enabled: bool) -> Dict[str, Any]:
     """Clean and parse a model response and enforce action contract. Raises ValueError on failure."""
     cleaned = clean_model_text(raw_text)
     try:
-        data = json.loads(cleaned)
+        data = fastjson.loads(cleaned)
     except Exception as e:
         raise ValueError(f"Invalid JSON after cleaning: {e}; first 120={cleaned[:120]!r}")
     return validate_payload(data, ocr_enabled=ocr_enabled)
 
 
-# Back-compat helper used by older tests and code paths. Returns (payload, err).
-def parse_structured_output(raw_text: str) -> Tuple[Dict[str, Any], str]:
+def parse_structured_payload(raw: str | dict[str, Any], *, ocr_enabled: bool = True) -> tuple[dict[str, Any], str]:
+    """Parse a model reply that may already be a dict (structured-output adapters). Returns (payload, err).
+
+    Dicts are validated in place, skipping clean_model_text and a JSON encode/decode round-trip.
+    """
     try:
-        payload = parse_step(raw_text, ocr_enabled=True)
+        if isinstance(raw, dict):
+            payload = validate_payload(raw, ocr_enabled=ocr_enabled)
+        else:
+            payload = parse_step(raw, ocr_enabled=ocr_enabled)
         # Ensure plan/say keys exist for downstream consumers
         payload.setdefault("plan", str(payload.get("plan", "")))
         payload.setdefault("say", payload.get("say"))
         return payload, ""
     except Exception as e:
         return {}, str(e)
+
+
+# Back-compat helper used by older tests and code paths. Returns (payload, err).
+def parse_structured_output(raw_text: str) -> Tuple[Dict[str, Any], str]:
+    return parse_structured_payload(raw_text, ocr_enabled=True)
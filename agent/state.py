@@ -1,9 +1,9 @@
 from __future__ import annotations
 # Environment: managed with 'uv' (https://github.com/astral-sh/uv). See README for setup.
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field
 from typing import Any, Dict, Optional
 
-@dataclass
+@dataclass(slots=True)
 class Step:
     step_index: int
     plan: str
@@ -14,6 +14,20 @@ class Step:
     screenshot_path: Optional[str]
     # Optional per-step telemetry for debugging/analysis (non-breaking)
     meta: Optional[Dict[str, Any]] = field(default=None)
+    # Serialized form, built on first to_json(); a Step is not mutated once the loop has logged it
+    _json: dict[str, Any] | None = field(default=None, init=False, repr=False, compare=False)
 
     def to_json(self) -> Dict[str, Any]:
-        return asdict(self)
+        # Shallow: args/meta are shared rather than deep-copied as dataclasses.asdict would
+        if self._json is None:
+            self._json = {
+                "step_index": self.step_index,
+                "plan": self.plan,
+                "next_action": self.next_action,
+                "args": self.args,
+                "say": self.say,
+                "observation": self.observation,
+                "screenshot_path": self.screenshot_path,
+                "meta": self.meta,
+            }
+        return self._json
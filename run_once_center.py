@@ -1,16 +1,13 @@
 #!/usr/bin/env python
 """Live run: move to center and click once using current config (may interact with your mouse!).
 """
-import os
-import yaml
 from rich.console import Console
 from agent.model import get_adapter
 from agent.loop import Stepper
-from datetime import datetime, timezone
+from agent.main import create_run_dir, load_config
 
 if __name__ == "__main__":
-    with open("config.yaml", "r", encoding="utf-8") as fp:
-        cfg = yaml.safe_load(fp)
+    cfg = load_config("config.yaml")
 
     # Honor current config; do NOT force dry_run
     run_live = not bool(cfg.get("dry_run", True))
@@ -18,9 +15,7 @@ if __name__ == "__main__":
     if not run_live:
         console.print("[yellow]Config has dry_run: true. This script will not perform real clicks.[/yellow]")
 
-    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
-    run_dir = os.path.join("runs", ts)
-    os.makedirs(run_dir, exist_ok=True)
+    run_dir = create_run_dir()
 
     adapter = get_adapter(cfg.get("provider"), cfg.get("model"), float(cfg.get("temperature",0.2)), int(cfg.get("max_output_tokens",800)))
     stepper = Stepper(cfg, run_dir, adapter, console)
@@ -15,6 +15,7 @@ import yaml
 from rich.console import Console
 from agent.model import get_adapter
 from agent.loop import Stepper
+from agent.main import load_config
 from datetime import datetime, timezone
 
 PROMPT = "move mouse to the exact center of the screen and click once, then say done"
@@ -55,8 +56,7 @@ def run_once(cfg, width):
 
 if __name__ == "__main__":
     console = Console()
-    with open("config.yaml", "r", encoding="utf-8") as fp:
-        cfg = yaml.safe_load(fp)
+    cfg = load_config("config.yaml")
 
     w1, w2 = 1280, 960
     console.print(f"[bold]Running detection at widths {w1} and {w2}[/bold]")
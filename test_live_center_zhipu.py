@@ -2,23 +2,18 @@
 """Live-model (Zhipu) dry-run validation: ask to click screen center and log meta.
 Safe: dry_run should be true in config.
 """
-import os
-import yaml
 from rich.console import Console
 from agent.model import get_adapter
 from agent.loop import Stepper
-from datetime import datetime, timezone
+from agent.main import create_run_dir, load_config
 
 if __name__ == "__main__":
-    with open("config.yaml", "r", encoding="utf-8") as fp:
-        cfg = yaml.safe_load(fp)
+    cfg = load_config("config.yaml")
 
     # Ensure we are in dry-run for safety
     cfg["dry_run"] = True
 
-    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
-    run_dir = os.path.join("runs", ts)
-    os.makedirs(run_dir, exist_ok=True)
+    run_dir = create_run_dir()
 
     console = Console()
     adapter = get_adapter(cfg.get("provider"), cfg.get("model"), float(cfg.get("temperature", 0.2)), int(cfg.get("max_output_tokens", 800)))
@@ -23,7 +23,7 @@ from agent.loop import Stepper
 from agent.model import get_adapter
 from dotenv import load_dotenv
 from rich.console import Console
-import yaml
+from agent.main import load_config
 
 load_dotenv()
 
@@ -183,8 +183,7 @@ def wait_for_first_step(steps_path: str, timeout_s: float, logger: logging.Logge
 
 def main():
     # Load config
-    with open("config.yaml") as f:
-        cfg = yaml.safe_load(f)
+    cfg = load_config("config.yaml")
 
     # Create run directory
     timestamp = datetime.now().strftime("%Y%m%dT%H%M%S")
@@ -1,21 +1,16 @@
 #!/usr/bin/env python
 """Quick test script to run the agent with a simple instruction."""
-import yaml
 from rich.console import Console
 from agent.model import get_adapter
 from agent.loop import Stepper
-import os
-from datetime import datetime, timezone
+from agent.main import create_run_dir, load_config
 
 def main():
     # Load config
-    with open("config.yaml", "r", encoding="utf-8") as fp:
-        cfg = yaml.safe_load(fp)
+    cfg = load_config("config.yaml")
     
     # Create run directory
-    ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
-    run_dir = os.path.join("runs", ts)
-    os.makedirs(run_dir, exist_ok=True)
+    run_dir = create_run_dir()
     
     # Create adapter and stepper
     console = Console()
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import pytest
-from agent.parser import parse_step
+from agent.parser import parse_step, parse_structured_payload
 
 def test_rejects_legacy_done():
     with pytest.raises(ValueError, match="Invalid next_action: DONE"):
@@ -40,4 +40,15 @@ def test_pointer_action_requires_coords():
 def test_pointer_action_accepts_valid_coords(coord_arg):
     for action in ["MOVE", "CLICK", "DOUBLE_CLICK", "RIGHT_CLICK", "DRAG"]:
         payload = parse_step(f'{{"next_action": "{action}", "args": {coord_arg}, "done": false}}', ocr_enabled=True)
-        assert payload["next_action"] == action
\ No newline at end of file
+        assert payload["next_action"] == action
+
+def test_structured_payload_accepts_dict():
+    payload, err = parse_structured_payload({"next_action": "WAIT", "args": {"seconds": 1}, "done": False})
+    assert err == ""
+    assert payload["next_action"] == "WAIT"
+    assert payload["plan"] == ""
+
+def test_structured_payload_validates_dict():
+    payload, err = parse_structured_payload({"next_action": "CLICK_TEXT", "done": False}, ocr_enabled=False)
+    assert payload == {}
+    assert "CLICK_TEXT not allowed" in err
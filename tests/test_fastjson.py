@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+import math
+
+from agent import fastjson
+
+
+def test_dumps_is_compact_utf8():
+    assert fastjson.dumps({"a": [1, "é"]}) == '{"a":[1,"é"]}'.encode()
+
+
+def test_loads_falls_back_for_input_orjson_rejects():
+    assert fastjson.loads('{"x": 1}') == {"x": 1}
+    assert math.isnan(fastjson.loads('{"x": NaN}')["x"])
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from agent.llm_cache import LLMCache
+
+
+def test_memory_lru_evicts_oldest_and_returns_copies():
+    cache = LLMCache("t:m", maxsize=2, cache_dir="")
+    keys = [cache.key(f"i{n}", [], b"img") for n in range(3)]
+    for k in keys:
+        cache.set(k, {"next_action": "NONE", "args": {}})
+    assert cache.get(keys[0]) is None
+    hit = cache.get(keys[2])
+    hit["args"]["x"] = 1
+    assert cache.get(keys[2]) == {"next_action": "NONE", "args": {}}
+    assert cache.stats == {"hits": 2, "misses": 1}
+
+
+def test_key_covers_namespace_and_screenshot():
+    a, b = LLMCache("openai:a", cache_dir=""), LLMCache("openai:b", cache_dir="")
+    assert a.key("i", [], b"x") != b.key("i", [], b"x")
+    assert a.key("i", [], b"x") != a.key("i", [], b"y")
+
+
+def test_key_ignores_run_specific_step_fields():
+    cache = LLMCache("t:m", cache_dir="")
+    step = {"plan": "p", "next_action": "NONE", "args": {}, "say": None, "observation": "ok"}
+    first = {**step, "step_index": 1, "screenshot_path": "runs/a/step_001.jpg", "meta": {"ms": 12}}
+    rerun = {**step, "step_index": 4, "screenshot_path": "runs/b/step_004.jpg", "meta": {"ms": 40}}
+    assert cache.key("i", [first], b"x") == cache.key("i", [rerun], b"x")
+    assert cache.key("i", [first], b"x") != cache.key("i", [{**first, "observation": "no"}], b"x")
+
+
+def test_disk_backend_survives_new_instance(tmp_path):
+    first = LLMCache("t:m", cache_dir=str(tmp_path))
+    key = first.key("i", [{"step_index": 1}], None)
+    first.set(key, "raw reply")
+    assert LLMCache("t:m", cache_dir=str(tmp_path)).get(key) == "raw reply"
+    first.discard(key)
+    assert LLMCache("t:m", cache_dir=str(tmp_path)).get(key) is None
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import agent.loop as loop_mod
+from agent import fastjson
+from agent.loop import ACTION_ARG_SCHEMAS, Stepper, _coerce, _norm_mean_abs_diff, _StepContext
+from agent.model import BaseModelAdapter
+from tools.screen import Screen
+
+SCREEN_SIZE = (1920, 1080)
+
+
+class ScriptedAdapter(BaseModelAdapter):
+    """Replays a fixed list of payloads, then reports done."""
+    def __init__(self, payloads):
+        self.payloads = list(payloads)
+        self.calls = []
+
+    def step(self, instruction, last_observation, recent_steps, image_b64_jpeg):
+        self.calls.append({"recent_steps": list(recent_steps), "image": image_b64_jpeg})
+        if self.payloads:
+            return self.payloads.pop(0)
+        return {"plan": "finish", "say": None, "next_action": "NONE", "args": {}, "done": True}
+
+
+@pytest.fixture
+def stepper(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        Screen, "capture",
+        lambda self, region=None: Image.new("RGB", (region[2], region[3]) if region else SCREEN_SIZE),
+    )
+    cfg = {
+        "dry_run": True,
+        "loop": {"max_steps": 3, "min_interval_ms": 0},
+        "verify": {"wait_ms": 0, "save_images": False, "retry": {"enabled": False}},
+    }
+    adapter = ScriptedAdapter([
+        {"plan": "click", "say": None, "next_action": "CLICK", "args": {"x": 1200, "y": 800}, "done": False},
+    ])
+    s = Stepper(cfg, os.path.join("runs", "20250101T000000"), adapter, console=None)
+    yield s
+    s.close()
+
+
+def _read_steps(stepper):
+    with open(stepper.log_path, "r", encoding="utf-8") as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_run_instruction_logs_step(stepper):
+    stepper.run_instruction("click the button")
+    steps = _read_steps(stepper)
+    assert [s["next_action"] for s in steps] == ["CLICK", "NONE"]
+    assert steps[0]["meta"]["coords"]["final"] == [1200, 800]
+    assert "verify" not in steps[0]["meta"]  # nothing to diff in dry-run
+    assert all(os.path.exists(s["screenshot_path"]) for s in steps)
+    calls = stepper.model.calls
+    assert calls[0]["recent_steps"] == []
+    assert calls[1]["recent_steps"] == steps[:1]
+
+
+def test_step_log_is_buffered_until_drained(stepper):
+    stepper._log({"step_index": 1})
+    assert os.path.getsize(stepper.log_path) == 0
+    stepper.close()
+    assert _read_steps(stepper) == [{"step_index": 1}]
+
+
+def test_coerce_applies_casts_and_defaults():
+    schema = ACTION_ARG_SCHEMAS["CLICK"]
+    assert _coerce({}, schema) == ("left", 1, 0.1)
+    assert _coerce({"button": "right", "clicks": "2", "interval": None}, schema) == ("right", 2, 0.1)
+
+
+def test_unchanged_screen_reuses_step_screenshot(stepper):
+    stepper.model.payloads = [
+        {"plan": "idle", "say": None, "next_action": "NONE", "args": {}, "done": False},
+    ]
+    stepper.run_instruction("do nothing")
+    steps = _read_steps(stepper)
+    assert len(steps) == 2
+    assert steps[0]["screenshot_path"] == steps[1]["screenshot_path"]
+
+
+def test_noop_steps_capture_a_fresh_frame(stepper, monkeypatch):
+    grabs = []
+
+    def changing_capture(self, region=None):
+        grabs.append(region)
+        return Image.new("RGB", SCREEN_SIZE, (len(grabs) * 40, 0, 0))
+
+    monkeypatch.setattr(Screen, "capture", changing_capture)
+    stepper.model.payloads = [
+        {"plan": "idle", "say": None, "next_action": "NONE", "args": {}, "done": False},
+    ] * 3
+    stepper.run_instruction("do nothing")
+    steps = _read_steps(stepper)
+    assert len(steps) == 3
+    # The screen changed between steps, so every step grabbed and showed the model a new frame
+    assert len(grabs) == 3
+    assert len({s["screenshot_path"] for s in steps}) == 3
+    assert len({c["image"] for c in stepper.model.calls}) == 3
+
+
+def test_rejected_reply_is_dropped_from_reply_cache(stepper, monkeypatch):
+    discarded = []
+    monkeypatch.setattr(stepper.model, "discard_cached_reply", lambda: discarded.append(True))
+    # Valid JSON, but CLICK_TEXT is refused while OCR is disabled
+    stepper.model.payloads = [
+        {"plan": "p", "say": None, "next_action": "CLICK_TEXT", "args": {"text": "OK"}, "done": False},
+    ]
+    stepper.run_instruction("press ok")
+    assert stepper.error_counts["parse_error"] == 1
+    assert discarded == [True]
+
+
+@pytest.mark.parametrize("action, args, expected", [
+    ("CLICK", {"x": 1200, "y": 800, "clicks": 3}, "(dry-run) click left 3x at 1200,800"),
+    ("DOUBLE_CLICK", {"x": 1200, "y": 800}, "(dry-run) click left 2x at 1200,800"),
+    ("RIGHT_CLICK", {"x": 1200, "y": 800, "button": "left"}, "(dry-run) click right 1x at 1200,800"),
+    ("DOUBLE_CLICK", {"x": "left", "y": "top"}, "missing coordinates; double-click skipped"),
+])
+def test_click_variants(stepper, action, args, expected):
+    stepper.model.payloads = [{"plan": "p", "say": None, "next_action": action, "args": args, "done": False}]
+    stepper.run_instruction("click")
+    assert _read_steps(stepper)[0]["observation"].startswith(expected)
+
+
+def test_session_log_is_flushed_on_close(stepper):
+    stepper._log_debug({"type": "probe"})
+    stepper._log({"step_index": 1, "observation": "é"})
+    stepper.close()
+    with open(stepper.session_log_path, "r", encoding="utf-8") as fp:
+        records = [json.loads(line) for line in fp]
+    assert records[0]["type"] == "session_start"
+    assert {"source": "debug", "data": {"type": "probe"}} in records
+    assert {"source": "steps", "data": {"step_index": 1, "observation": "é"}} in records
+    assert records[-1] == {"type": "session_end"}
+
+
+def test_identical_frame_reuses_jpeg(stepper):
+    first, _ = stepper.screen.capture_jpeg(width=640, quality=60)
+    again, _ = stepper.screen.capture_jpeg(width=640, quality=60)
+    requality, _ = stepper.screen.capture_jpeg(width=640, quality=50)
+    assert again is first
+    assert requality is not first
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_norm_mean_abs_diff(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(loop_mod, "np", None)
+    black = Image.new("RGB", (8, 8))
+    half = Image.new("RGB", (8, 8))
+    half.paste((255, 255, 255), (0, 0, 8, 4))
+    assert _norm_mean_abs_diff(black, black) == 0.0
+    assert _norm_mean_abs_diff(black, half) == pytest.approx(0.5)
+    assert _norm_mean_abs_diff(black, half.resize((16, 16))) == pytest.approx(0.5)
+
+
+def test_model_reply_logged_once_per_step(stepper):
+    stepper.run_instruction("click the button")
+    stepper.close()
+    with open(stepper.debug_path, "r", encoding="utf-8") as fp:
+        records = [json.loads(line) for line in fp]
+    parsed = [r for r in records if r["type"] == "model_parsed"]
+    assert not any(r["type"] == "model_raw" for r in records)
+    assert [r["step_index"] for r in parsed] == [1, 2]
+    assert parsed[0]["raw"]["next_action"] == "CLICK"
+    assert "cleaned" not in parsed[0]
+
+
+def test_verify_images_written_in_background(stepper):
+    stepper._verify_enabled = True
+    stepper._save_verify = True
+    stepper.run_instruction("click the button")
+    images = _read_steps(stepper)[0]["meta"]["verify"]["images"]
+    for path in images.values():
+        assert path.endswith(".jpg")
+        with Image.open(path) as img:
+            assert img.format == "JPEG"
+
+
+@pytest.mark.parametrize("bbox, final, system", [
+    ([1100, 500, 1300, 700], [1200, 600], "screen_bbox"),
+    ([-10, 500, 1300, 700], [645, 600], "screen_bbox"),
+])
+def test_process_coords_bbox(stepper, bbox, final, system):
+    ctx = _StepContext(1, Image.new("RGB", (1280, 720)), *SCREEN_SIZE, 1.5, 1.5)
+    x, y, _, meta = stepper._process_coords(None, None, {"bbox": bbox}, ctx)
+    assert [x, y] == final
+    assert meta["scaling"]["mode"] == system
+
+
+def test_drag_accepts_point_object(stepper):
+    stepper.model.payloads = [
+        {"plan": "p", "say": None, "next_action": "DRAG", "args": {"point": {"x": 1500, "y": 900}}, "done": False},
+    ]
+    stepper.run_instruction("drag")
+    step = _read_steps(stepper)[0]
+    assert step["observation"].startswith("(dry-run) drag to 1500,900")
+    assert step["meta"]["coords"]["final"] == [1500, 900]
+
+
+def test_missing_coordinates_skip_verification(stepper, monkeypatch):
+    stepper._verify_enabled = True
+    regions = []
+    monkeypatch.setattr(Screen, "capture", lambda self, region=None: regions.append(region) or Image.new("RGB", SCREEN_SIZE))
+    stepper.model.payloads = [
+        {"plan": "p", "say": None, "next_action": "CLICK", "args": {"x": "left", "y": "top"}, "done": False},
+    ]
+    stepper.run_instruction("click")
+    step = _read_steps(stepper)[0]
+    assert step["observation"].startswith("missing coordinates")
+    assert "verify" not in step["meta"]
+    assert all(r is None for r in regions)
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_norm_mean_abs_diff_large_region_subsampled(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(loop_mod, "np", None)
+    # 1px stripes shifted by one pixel: every pixel flips, which averaging would hide
+    stripes = Image.new("L", (600, 400))
+    stripes.putdata([255 * (x % 2) for _y in range(400) for x in range(600)])
+    shifted = stripes.transform(stripes.size, Image.AFFINE, (1, 0, 1, 0, 1, 0))
+    assert _norm_mean_abs_diff(stripes.convert("RGB"), shifted.convert("RGB")) > 0.9
+
+
+def test_log_sync_writes_through(stepper):
+    s = Stepper({**stepper.cfg, "logging": {"sync": True}}, os.path.join("runs", "sync"), stepper.model, console=None)
+    try:
+        s._log({"step_index": 1})
+        assert _read_steps(s) == [{"step_index": 1}]
+    finally:
+        s.close()
+
+
+def test_first_step_reuses_screen_size_probe(stepper, monkeypatch):
+    grabs = []
+    monkeypatch.setattr(Screen, "capture", lambda self, region=None: grabs.append(region) or Image.new("RGB", SCREEN_SIZE))
+    stepper.run_instruction("click the button")
+    # one probe (reused for step 1) + one fresh grab for step 2
+    assert grabs == [None, None]
+
+
+def test_exit_hook_flushes_unclosed_stepper(stepper):
+    stepper._log({"step_index": 1})
+    fastjson._flush_open_writers()
+    assert _read_steps(stepper) == [{"step_index": 1}]
+    stepper.close()
+    assert stepper._step_log not in fastjson._OPEN_WRITERS
+
+
+def test_webp_screenshots(stepper):
+    stepper._loopcfg = dataclasses.replace(stepper._loopcfg, shot_fmt="webp")
+    stepper.run_instruction("click the button")
+    steps = _read_steps(stepper)
+    assert steps[0]["screenshot_path"].endswith(".webp")
+    assert stepper.model.calls[0]["image"][8:12] == b"WEBP"
+
+
+def test_model_history_is_bounded(stepper):
+    stepper._loopcfg = dataclasses.replace(stepper._loopcfg, max_steps=9)
+    stepper.model.payloads = [
+        {"plan": f"idle {i}", "say": None, "next_action": "NONE", "args": {}, "done": False} for i in range(8)
+    ]
+    stepper.run_instruction("idle")
+    last = stepper.model.calls[-1]["recent_steps"]
+    assert [s["plan"] for s in last] == [f"idle {i}" for i in range(2, 8)]
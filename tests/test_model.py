@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import base64
+from types import SimpleNamespace
+
+import pytest
+
+from agent.model import BaseModelAdapter, _image_b64, _image_bytes, _image_data_url
+
+JPEG = b"\xff\xd8\xff\xe0fake-jpeg"
+B64 = base64.b64encode(JPEG).decode("ascii")
+DATA_URL = f"data:image/jpeg;base64,{B64}"
+
+
+def test_image_helpers_accept_raw_bytes():
+    assert _image_b64(JPEG) == B64
+    assert _image_data_url(JPEG) == DATA_URL
+    assert _image_bytes(JPEG) == JPEG
+
+
+def test_image_helpers_accept_data_url():
+    assert _image_b64(DATA_URL) == B64
+    assert _image_data_url(DATA_URL) == DATA_URL
+    assert _image_bytes(DATA_URL) == JPEG
+
+
+def test_image_b64_reuses_encoding_for_same_bytes_object():
+    first = _image_b64(JPEG)
+    assert _image_b64(JPEG) is first
+    assert _image_b64(bytes(bytearray(JPEG))) == first
+
+
+class _EchoAdapter(BaseModelAdapter):
+    def __init__(self):
+        self.client = self
+        self.closed = False
+
+    def step(self, instruction, last_observation, recent_steps, image_b64_jpeg):
+        return {"instruction": instruction, "steps": len(recent_steps)}
+
+    def close(self):
+        self.closed = True
+
+
+def test_base_close_closes_sdk_client():
+    adapter = _EchoAdapter()
+    BaseModelAdapter.close(adapter)
+    assert adapter.closed
+
+
+class _FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        msg = SimpleNamespace(content='{"plan":"p","next_action":"NONE","args":{},"done":true}', parsed=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=msg, finish_reason="stop")])
+
+
+def test_openai_request_envelope_is_reused(monkeypatch):
+    pytest.importorskip("openai")
+    from agent.model import OpenAIAdapter
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    adapter = OpenAIAdapter("gpt-test", 0.2, 100)
+    completions = _FakeCompletions()
+    adapter.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    adapter.step("a", "", [], JPEG)
+    adapter.step("b", "", [], None)
+    first, second = completions.calls
+    assert first["messages"][0] is second["messages"][0]
+    assert first["response_format"] is second["response_format"]
+    assert first["messages"][1]["content"][1]["image_url"]["url"] == DATA_URL
+    assert len(second["messages"][1]["content"]) == 1
+
+
+def test_image_mime_follows_encoded_format():
+    from agent.model import _image_mime
+    webp = b"RIFF\x00\x00\x00\x00WEBPVP8 "
+    assert _image_mime(JPEG) == "image/jpeg"
+    assert _image_mime(webp) == "image/webp"
+    assert _image_data_url(webp).startswith("data:image/webp;base64,")
+    assert _image_mime("data:image/webp;base64,AAAA") == "image/webp"
+
+
+def test_get_adapter_dispatch():
+    from agent.model import DummyAdapter, get_adapter
+    assert isinstance(get_adapter("dummy", "m", 0.0, 10), DummyAdapter)
+    with pytest.raises(ValueError, match="Unknown provider: nope"):
+        get_adapter("nope", "m", 0.0, 10)
+
+
+def test_cached_step_skips_provider_on_repeat_call():
+    from agent.model import LLMCache, _cached_step, _UncachedReply
+
+    class _CountingAdapter(_EchoAdapter):
+        calls = 0
+        reply = '{"plan": "p", "say": null, "next_action": "NONE", "args": {}, "done": true}'
+
+        @_cached_step
+        def step(self, instruction, last_observation, recent_steps, image_b64_jpeg):
+            self.calls += 1
+            return self.reply
+
+    adapter = _CountingAdapter()
+    adapter.step("go", "", [], JPEG)
+    adapter.step("go", "", [], JPEG)
+    assert adapter.calls == 2  # no cache unless temperature is 0
+    adapter._cache = LLMCache("t:m", cache_dir="")
+    assert adapter.step("go", "", [], JPEG) == adapter.step("go", "", [], JPEG)
+    assert adapter.calls == 3
+    # A reply the caller rejected is dropped, so the next call goes back to the provider
+    adapter.discard_cached_reply()
+    adapter.step("go", "", [], JPEG)
+    assert adapter.calls == 4
+    # Fallback replies are never stored
+    adapter.reply = _UncachedReply(adapter.reply)
+    adapter.step("stop", "", [], JPEG)
+    adapter.step("stop", "", [], JPEG)
+    assert adapter.calls == 6
+
+
+def test_zhipu_error_log_is_structured(monkeypatch, tmp_path):
+    pytest.importorskip("openai")
+    import json
+    import time
+
+    from agent.model import _ZHIPU_FALLBACK_REPLY, ZhipuAdapter
+
+    class _Failing:
+        def create(self, **kwargs):
+            raise TimeoutError("upstream timed out")
+
+    monkeypatch.setenv("ZHIPU_API_KEY", "test")
+    monkeypatch.delenv("DESKTOPOPS_DEBUG_TRACEBACK", raising=False)
+    monkeypatch.delenv("ZHIPU_BASE_URL", raising=False)
+    monkeypatch.setattr(time, "sleep", lambda s: None)
+    adapter = ZhipuAdapter("glm-4.5v", 0.2, 100)
+    adapter.set_debug_dir(str(tmp_path))
+    adapter.client = SimpleNamespace(chat=SimpleNamespace(completions=_Failing()))
+    assert adapter.step("a", "", [], None) is _ZHIPU_FALLBACK_REPLY
+    adapter.close()
+    with open(tmp_path / "provider_zhipu.jsonl", encoding="utf-8") as fp:
+        records = list(map(json.loads, fp))
+    errors = [r for r in records if r["type"] == "provider_error"]
+    calls = [r for r in records if r["type"] == "provider_call"]
+    assert [c["endpoint_base"] for c in calls] == ["https://api.z.ai/api/coding/paas/v4"] * 3
+    assert [e["error"] for e in errors] == ["TimeoutError: upstream timed out"] * 3
+    assert "traceback" not in errors[0]
+
+
+def test_recent_steps_rendered_as_bounded_json():
+    import json
+    from collections import deque
+
+    from agent.model import _recent_steps_text
+    steps = deque({"step_index": i, "done": False, "say": None} for i in range(8))
+    text = _recent_steps_text(steps)
+    assert [s["step_index"] for s in json.loads(text)] == [2, 3, 4, 5, 6, 7]
+    assert "None" not in text and "False" not in text
+    assert _recent_steps_text([]) == "[]"
+
+
+def test_step_schema_enum_matches_parser_actions():
+    from agent.model import _STEP_SCHEMA
+    from agent.parser import ALLOWED_ACTIONS
+    enum = _STEP_SCHEMA["schema"]["properties"]["next_action"]["enum"]
+    assert set(enum) == ALLOWED_ACTIONS and len(enum) == len(ALLOWED_ACTIONS)
+
+
+def test_anthropic_returns_forced_tool_input(monkeypatch):
+    pytest.importorskip("anthropic")
+    from agent.model import AnthropicAdapter
+    payload = {"plan": "p", "say": None, "next_action": "NONE", "args": {}, "done": True}
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(content=[SimpleNamespace(type="tool_use", input=payload)])
+
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    adapter = AnthropicAdapter("claude-test", 0.2, 100)
+    adapter.client = SimpleNamespace(messages=SimpleNamespace(create=create))
+    assert adapter.step("a", "", [], JPEG) is payload
+    assert calls[0]["tool_choice"] == {"type": "tool", "name": "desktop_step"}
+    assert calls[0]["tools"][0]["input_schema"]["required"] == ["plan", "next_action", "args", "done"]
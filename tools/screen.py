@@ -1,5 +1,6 @@
 from __future__ import annotations
 import base64
+import hashlib
 import io
 import os
 import platform
@@ -13,12 +14,25 @@ try:
 except Exception:
     mss = None
 
+def image_mime(data) -> str:
+    """MIME type of an encoded screenshot from its magic bytes: image/webp, else image/jpeg."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
 class Screen:
     def __init__(self, run_dir: str):
         self.run_dir = run_dir
         os.makedirs(self.run_dir, exist_ok=True)
         self._is_windows = platform.system().lower() == "windows"
         self._use_native = self._is_windows
+        # Reused across captures; truncated before each encode to avoid per-step allocation churn
+        self._jpeg_buf = io.BytesIO()
+        # (pixel digest, (quality, fmt), encoded) of the last encode; an identical frame skips the encoder
+        self._last_jpeg: tuple[bytes, tuple[int, str], bytes] | None = None
+        # (jpeg, data URL) of the last capture_and_encode(); reused while capture_jpeg returns the same bytes
+        self._last_data_url: tuple[bytes, str] | None = None
 
     def capture(self, region: Optional[Tuple[int,int,int,int]] = None) -> Image.Image:
         # On Windows, prefer native PIL.ImageGrab for speed
@@ -52,18 +66,77 @@ class Screen:
         img = Image.frombytes("RGB", raw.size, raw.rgb)
         return img
 
-    def capture_and_encode(self, width: int = 1280, quality: int = 70):
-        img = self.capture()
+    def capture_jpeg(self, width: int = 1280, quality: int = 70, fmt: str = "jpeg") -> tuple[bytes, Image.Image]:
+        """Capture, downscale and JPEG-encode the screen. Returns (jpeg_bytes, image).
+
+        fmt="webp" encodes WebP instead (typically much smaller for flat UI frames); use
+        image_mime() on the bytes to tell the two apart. When the downscaled frame is
+        pixel-identical to the previous one, the previous bytes object itself is returned,
+        so callers can detect reuse with `is`.
+        """
+        return self.encode_jpeg(self.capture(), width=width, quality=quality, fmt=fmt)
+
+    def encode_jpeg(self, img: Image.Image, width: int = 1280, quality: int = 70,
+                    fmt: str = "jpeg") -> tuple[bytes, Image.Image]:
+        """Downscale and encode an already captured frame; same contract as capture_jpeg()."""
         if width and img.width > width:
             h = int(img.height * (width / img.width))
-            img = img.resize((width, h))
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=quality, optimize=True)
-        b64 = base64.b64encode(buf.getvalue()).decode("ascii")
-        return f"data:image/jpeg;base64,{b64}", img
+            img = img.resize((width, h), Image.BILINEAR)
+        digest = hashlib.blake2b(img.tobytes(), digest_size=16).digest()
+        key = (quality, fmt)
+        last = self._last_jpeg
+        if last is not None and last[0] == digest and last[1] == key:
+            return last[2], img
+        buf = self._jpeg_buf
+        buf.seek(0)
+        buf.truncate()
+        if fmt == "webp":
+            # Fastest of Pillow's 0-6 WebP presets: this encode runs on the step loop
+            img.save(buf, format="WEBP", quality=quality, method=0)
+        else:
+            # Baseline 4:2:0 JPEG without the extra Huffman optimisation pass: much cheaper to encode
+            img.save(buf, format="JPEG", quality=quality, optimize=False, progressive=False, subsampling=2)
+        jpeg = buf.getvalue()
+        self._last_jpeg = (digest, key, jpeg)
+        return jpeg, img
 
-    def save_step_image(self, pil_img, step_index: int) -> str:
+    def capture_and_encode(self, width: int = 1280, quality: int = 70, fmt: str = "jpeg"):
+        """Like capture_jpeg(), but returns the image as a data:image/...;base64 URL."""
+        jpeg, img = self.capture_jpeg(width=width, quality=quality, fmt=fmt)
+        last = self._last_data_url
+        if last is not None and last[0] is jpeg:
+            return last[1], img
+        url = f"data:{image_mime(jpeg)};base64," + base64.b64encode(jpeg).decode("ascii")
+        self._last_data_url = (jpeg, url)
+        return url, img
+
+    def step_image_path(self, image, step_index: int) -> str:
+        """Path save_step_image/write_step_image use for this image: .jpg/.webp if already encoded, else .png."""
         ts = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
-        path = os.path.join(self.run_dir, f"step_{step_index:04d}_{ts}.png")
-        pil_img.save(path, format="PNG")
+        if isinstance(image, Image.Image):
+            ext = "png"
+        elif isinstance(image, str):
+            ext = "webp" if image.startswith("data:image/webp") else "jpg"
+        else:
+            ext = "webp" if image_mime(image) == "image/webp" else "jpg"
+        return os.path.join(self.run_dir, f"step_{step_index:04d}_{ts}.{ext}")
+
+    @staticmethod
+    def write_step_image(image, path: str) -> str:
+        """Write a step screenshot to a path from step_image_path(); safe to run on a worker thread.
+
+        Accepts the already-encoded JPEG/WebP (bytes from capture_jpeg or the data URL from
+        capture_and_encode), which is written as-is, or a PIL image, which is re-encoded as PNG.
+        """
+        if isinstance(image, str):
+            image = base64.b64decode(image.split(",", 1)[1] if image.startswith("data:") else image)
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            with open(path, "wb") as fp:
+                fp.write(image)
+        else:
+            image.save(path, format="PNG")
         return path
+
+    def save_step_image(self, image, step_index: int) -> str:
+        """Persist a step screenshot synchronously and return its path."""
+        return self.write_step_image(image, self.step_image_path(image, step_index))